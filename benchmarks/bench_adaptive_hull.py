@@ -0,0 +1,89 @@
+"""
+Resolution vs. time vs. peak memory of the two-view hull, dense grid against the adaptive
+(brick refined) mode, on synthetic silhouettes of a part with a through hole and a thin slot.
+
+Each run is a fresh interpreter so its peak RSS is its own. Dense runs above --dense-max are
+skipped: a dense 1024³ grid alone is 1 GB before Marching Cubes starts.
+
+Usage (from the repository root):
+    python benchmarks/bench_adaptive_hull.py [--resolutions 256,512,1024,1536] [--csv curve.csv]
+"""
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+
+PROBE = """
+import json, os, resource, sys, tempfile, time
+import cv2
+import numpy as np
+from src.services import reconstruction_service as rs
+
+mode, resolution, brick = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+
+def silhouettes(h):
+    front = np.zeros((h + 2, int(h * 0.6) + 2), np.uint8)
+    side = np.zeros((h + 2, int(h * 0.5) + 2), np.uint8)
+    cx = front.shape[1] // 2
+    cv2.ellipse(front, (cx, h // 2), (front.shape[1] // 3, h // 2 - 4), 0, 0, 360, 255, -1)
+    cv2.circle(front, (cx, h // 3), h // 12, 0, -1)
+    cv2.rectangle(front, (cx - max(1, h // 200), h // 2), (cx + max(1, h // 200), h - h // 8), 0, -1)
+    cv2.rectangle(side, (4, 8), (side.shape[1] - 5, h - 8), 255, -1)
+    return front > 0, side > 0
+
+front, side = silhouettes(resolution)
+rs.OUTPUT_DIR = tempfile.mkdtemp()
+if mode == "dense":
+    strategy = rs.SilhouetteReconstructionStrategy.__new__(rs.SilhouetteReconstructionStrategy)
+else:
+    strategy = rs.AdaptiveSilhouetteReconstructionStrategy.__new__(rs.AdaptiveSilhouetteReconstructionStrategy)
+    strategy.brick = brick
+
+import skimage.measure, trimesh  # keep import time out of the measurement
+started = time.perf_counter()
+path = strategy.build_mesh(front, side, mode, resolution)
+elapsed = time.perf_counter() - started
+faces = (os.path.getsize(path) - 84) // 50  # binary STL: 84 byte header, 50 bytes per triangle
+print(json.dumps({
+    "seconds": elapsed,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "faces": faces,
+}))
+"""
+
+def run_once(root: str, mode: str, resolution: int, brick: int) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE, mode, str(resolution), str(brick)],
+        cwd=root, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--resolutions", default="256,512,1024,1536")
+    parser.add_argument("--brick", type=int, default=32)
+    parser.add_argument("--dense-max", type=int, default=512, help="Largest resolution run with the dense grid")
+    parser.add_argument("--csv", help="Also write the curve to this CSV file")
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    rows = []
+    print(f"{'mode':<9}{'resolution':>11}{'seconds':>10}{'peak RSS MB':>13}{'faces':>11}")
+    for resolution in (int(r) for r in args.resolutions.split(",")):
+        for mode in ("dense", "adaptive"):
+            if mode == "dense" and resolution > args.dense_max:
+                continue
+            result = run_once(root, mode, resolution, args.brick)
+            rows.append({"mode": mode, "resolution": resolution, **result})
+            print(f"{mode:<9}{resolution:>11}{result['seconds']:>10.2f}{result['peak_rss_mb']:>13.0f}{result['faces']:>11}")
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=["mode", "resolution", "seconds", "peak_rss_mb", "faces"])
+            writer.writeheader()
+            writer.writerows(rows)
+
+if __name__ == "__main__":
+    main()
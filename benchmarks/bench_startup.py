@@ -0,0 +1,50 @@
+"""
+Measures API cold start: the time a fresh interpreter needs to import src.main, and which
+heavy modules got imported along the way (none of them should be, the reconstruction stack
+is loaded lazily).
+
+Usage (from the repository root):
+    python benchmarks/bench_startup.py [--runs 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ["rembg", "onnxruntime", "trimesh", "skimage"]
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import src.main
+elapsed = time.perf_counter() - started
+print(json.dumps({"seconds": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+def run_once(root: str) -> dict:
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", "sqlite:///./bench_startup.db")
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=root, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = [run_once(root) for _ in range(args.runs)]
+    timings = [r["seconds"] for r in results]
+
+    print(f"import src.main over {args.runs} runs")
+    print(f"  median: {statistics.median(timings) * 1000:.0f} ms")
+    print(f"  min:    {min(timings) * 1000:.0f} ms")
+    print(f"  max:    {max(timings) * 1000:.0f} ms")
+    print(f"  heavy modules loaded at import: {results[-1]['loaded'] or 'none'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Accuracy gate for faster segmentation models.
+
+Runs the reference model (full-precision U2Net by default) and a candidate model over a local
+folder of images and reports, per image, the IoU between both masks and the time each took.
+Exits with status 1 when the mean IoU falls below --min-iou, so it can guard a deployment change.
+
+A candidate is any value accepted by SEGMENTATION_MODEL: a rembg model name (u2netp, silueta, ...)
+or the path to an ONNX file. --quantize produces an INT8 (dynamic quantization) copy of an ONNX
+model first and uses it as the candidate. The special candidates "classical" and "fast-path"
+evaluate the backdrop segmentation alone and with its rembg fallback.
+
+Usage (from the repository root):
+    python benchmarks/segmentation_accuracy.py --images ./samples --candidate u2netp
+    python benchmarks/segmentation_accuracy.py --images ./samples \\
+        --quantize ~/.u2net/u2net.onnx --candidate ./u2net_int8.onnx
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.segmentation_service import (
+    ClassicalSegmentation, FastPathSegmentation, RembgSegmentation, SegmentationStrategy, get_segmentation_session,
+)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+def quantize(source: str, target: str):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    quantize_dynamic(source, target, weight_type=QuantType.QUInt8)
+    print(f"INT8 model written to {target}")
+
+def iou(mask_a: np.ndarray, mask_b: np.ndarray) -> float:
+    a, b = mask_a > 0, mask_b > 0
+    union = np.logical_or(a, b).sum()
+    return 1.0 if union == 0 else float(np.logical_and(a, b).sum() / union)
+
+def build_segmentation(candidate: str, reference: RembgSegmentation) -> SegmentationStrategy:
+    if candidate == "classical":
+        return ClassicalSegmentation()
+    if candidate == "fast-path":
+        return FastPathSegmentation(fallback=reference)
+    get_segmentation_session(candidate)
+    return RembgSegmentation(candidate)
+
+def timed_mask(segmentation: SegmentationStrategy, img: np.ndarray):
+    started = time.perf_counter()
+    mask = segmentation.segment(img)
+    return mask, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", required=True, help="Folder with sample captures")
+    parser.add_argument("--reference", default="u2net")
+    parser.add_argument("--candidate", required=True)
+    parser.add_argument("--quantize", metavar="SOURCE_ONNX", help="Quantize this model into --candidate first")
+    parser.add_argument("--min-iou", type=float, default=0.95)
+    args = parser.parse_args()
+
+    if args.quantize:
+        quantize(args.quantize, args.candidate)
+
+    # Load the models up front so session creation is not timed as inference
+    get_segmentation_session(args.reference)
+    reference = RembgSegmentation(args.reference)
+    candidate = build_segmentation(args.candidate, reference)
+
+    paths = sorted(
+        os.path.join(args.images, name) for name in os.listdir(args.images)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if not paths:
+        parser.error(f"No images found in {args.images}")
+
+    scores, reference_times, candidate_times = [], [], []
+    print(f"{'image':40} {'IoU':>7} {'ref ms':>8} {'cand ms':>8} path")
+    for path in paths:
+        img = cv2.imread(path, cv2.IMREAD_COLOR)
+        if img is None:
+            print(f"{os.path.basename(path):40} unreadable, skipped")
+            continue
+        reference_mask, reference_time = timed_mask(reference, img)
+        candidate_mask, candidate_time = timed_mask(candidate, img)
+        score = iou(reference_mask, candidate_mask)
+
+        scores.append(score)
+        reference_times.append(reference_time)
+        candidate_times.append(candidate_time)
+        print(f"{os.path.basename(path):40} {score:7.4f} {reference_time * 1000:8.1f} {candidate_time * 1000:8.1f} {candidate.last_path}")
+
+    mean_iou = statistics.mean(scores)
+    speedup = statistics.median(reference_times) / statistics.median(candidate_times)
+    print()
+    print(f"images:       {len(scores)}")
+    print(f"mean IoU:     {mean_iou:.4f} (min {min(scores):.4f})")
+    print(f"median speed: {speedup:.2f}x vs {args.reference}")
+
+    if mean_iou < args.min_iou:
+        print(f"FAIL: mean IoU below {args.min_iou}")
+        sys.exit(1)
+    print(f"PASS: mean IoU >= {args.min_iou}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+class JobCancelled(Exception):
+    """Raised at a pipeline checkpoint once the job was cancelled; 'status' is the final job status."""
+    status = "CANCELLED"
+
+class JobTimedOut(JobCancelled):
+    status = "TIMED_OUT"
+
+class CancellationToken:
+    """
+    Cooperative abort for one job. Long stages call check() between steps; it raises once the
+    deadline (a time.time() timestamp) has passed or the job was cancelled, either in this process
+    through cancel() or elsewhere as reported by 'is_cancelled' (polled every 'poll_interval' s).
+    """
+    def __init__(self, deadline: Optional[float] = None, is_cancelled: Optional[Callable[[], bool]] = None,
+                 poll_interval: float = 2.0):
+        self.deadline = deadline
+        self.is_cancelled = is_cancelled
+        self.poll_interval = poll_interval
+        self._event = threading.Event()
+        self._last_poll = time.monotonic()
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the deadline (at least 1, for use as an I/O timeout)."""
+        return None if self.deadline is None else max(1.0, self.deadline - time.time())
+
+    def check(self) -> None:
+        if self._event.is_set():
+            raise JobCancelled("Job cancelado.")
+        if self.deadline is not None and time.time() > self.deadline:
+            raise JobTimedOut("Prazo do job esgotado.")
+        if self.is_cancelled is not None and time.monotonic() - self._last_poll >= self.poll_interval:
+            self._last_poll = time.monotonic()
+            if self.is_cancelled():
+                self._event.set()
+                raise JobCancelled("Job cancelado.")
+
+class CancellationRegistry:
+    """Tokens of the jobs running in this process, so a cancel request reaches them immediately."""
+    def __init__(self):
+        self._tokens: Dict[int, CancellationToken] = {}
+        self._lock = threading.Lock()
+
+    def register(self, job_id: int, token: CancellationToken) -> CancellationToken:
+        with self._lock:
+            self._tokens[job_id] = token
+        return token
+
+    def cancel(self, job_id: int) -> bool:
+        with self._lock:
+            token = self._tokens.get(job_id)
+        if token is None:
+            return False
+        token.cancel()
+        return True
+
+    def discard(self, job_id: int) -> None:
+        with self._lock:
+            self._tokens.pop(job_id, None)
+
+cancellations = CancellationRegistry()
@@ -1,10 +1,12 @@
 from fastapi import Depends
 from sqlalchemy.orm import Session
-from .database import get_db
-from ..repositories.interfaces import IPartRepository, IJobRepository, IStatsRepository
-from ..repositories.sqlalchemy_impl import SqlAlchemyPartRepository, SqlAlchemyJobRepository, SqlAlchemyStatsRepository
+from typing import Callable
+from .database import get_db, SessionLocal
+from ..repositories.interfaces import IPartRepository, IJobRepository, IStatsRepository, IDerivativeRepository, IPartExporter, IJobExporter
+from ..repositories.sqlalchemy_impl import SqlAlchemyPartRepository, SqlAlchemyJobRepository, SqlAlchemyStatsRepository, SqlAlchemyBlobIndex, SqlAlchemyDerivativeRepository
 from ..services.storage import IFileStorage, LocalFileStorage, CloudinaryFileStorage
-from ..services.defect_service import DefectService, OpenCVContrastDefectDetector
+from ..services.defect_service import DefectService, OpenCVContrastDefectDetector, defect_result_cache
+from ..workers.scheduler import JobScheduler, scheduler
 import os
 
 def get_part_repository(db: Session = Depends(get_db)) -> IPartRepository:
@@ -16,11 +18,33 @@ def get_job_repository(db: Session = Depends(get_db)) -> IJobRepository:
 def get_stats_repository(db: Session = Depends(get_db)) -> IStatsRepository:
     return SqlAlchemyStatsRepository(db)
 
+def get_derivative_repository(db: Session = Depends(get_db)) -> IDerivativeRepository:
+    return SqlAlchemyDerivativeRepository(db)
+
+def get_session_factory() -> Callable[[], Session]:
+    # For streaming responses, which outlive the request-scoped session from get_db
+    return SessionLocal
+
+def get_part_exporter_factory() -> Callable[[Session], IPartExporter]:
+    # Bound to a session from get_session_factory by the streaming response itself
+    return SqlAlchemyPartRepository
+
+def get_job_exporter_factory() -> Callable[[Session], IJobExporter]:
+    return SqlAlchemyJobRepository
+
 def get_file_storage() -> IFileStorage:
+    blob_index = SqlAlchemyBlobIndex(SessionLocal)
     if os.getenv("CLOUDINARY_URL"):
-        return CloudinaryFileStorage()
-    return LocalFileStorage(base_url=os.getenv("API_BASE_URL", "http://localhost:8000"))
+        return CloudinaryFileStorage(blob_index=blob_index)
+    return LocalFileStorage(base_url=os.getenv("API_BASE_URL", "http://localhost:8000"), blob_index=blob_index)
+
+def get_scheduler() -> JobScheduler:
+    # Process-wide, so priorities and quotas hold across requests
+    return scheduler
 
 def get_defect_service() -> DefectService:
     # Injecting the concrete strategy here (Composition Root for this scope)
-    return DefectService(OpenCVContrastDefectDetector())
+    return DefectService(
+        OpenCVContrastDefectDetector(max_side=int(os.getenv("DEFECT_MAX_SIDE", "0"))),
+        cache=defect_result_cache,
+    )
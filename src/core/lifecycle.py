@@ -0,0 +1,97 @@
+import os
+import threading
+import time
+
+from .database import SessionLocal, engine
+
+# Schema creation is a DB round trip; deployments that manage the schema themselves can skip it
+AUTO_CREATE_SCHEMA = os.getenv("AUTO_CREATE_SCHEMA", "1") == "1"
+# Loads the segmentation model in the background so the first reconstruction does not pay for it
+WARMUP_RECONSTRUCTION = os.getenv("WARMUP_RECONSTRUCTION", "1") == "1"
+
+class ServiceState:
+    """
+    Process-wide startup progress, reported by the health endpoints.
+    """
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.schema_ready = False
+        self.warmup_status = "pending" if WARMUP_RECONSTRUCTION else "disabled"
+        self.warmup_seconds = None
+        self.warmup_error = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.schema_ready
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "schema": "ready" if self.schema_ready else "pending",
+                "warmup": self.warmup_status,
+                "warmupSeconds": self.warmup_seconds,
+                "warmupError": self.warmup_error,
+                "uptimeSeconds": round(time.monotonic() - self.started_at, 3),
+            }
+
+state = ServiceState()
+
+def create_missing_indexes(metadata):
+    """
+    Adds the declared indexes that existing tables lack; create_all only indexes the tables it creates.
+    """
+    from sqlalchemy import inspect
+
+    inspector = inspect(engine)
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                print(f"Creating index {index.name} on {table.name}")
+                index.create(bind=engine)
+
+def init_schema():
+    """
+    Creates missing tables (outside import time, so a cold start does not wait on the DB)
+    and seeds the dashboard counter rows, so writes from the first requests are counted.
+    """
+    from ..repositories.sqlalchemy_impl import seed_counters
+
+    if AUTO_CREATE_SCHEMA:
+        from ..domain import models
+        models.Base.metadata.create_all(bind=engine)
+        create_missing_indexes(models.Base.metadata)
+    db = SessionLocal()
+    try:
+        seed_counters(db)
+        db.commit()
+    finally:
+        db.close()
+    state.schema_ready = True
+
+def warm_up_reconstruction():
+    if not WARMUP_RECONSTRUCTION:
+        return
+
+    state.warmup_status = "running"
+    started = time.monotonic()
+    try:
+        from ..services import reconstruction_service
+        reconstruction_service.warm_up()
+        state.warmup_status = "done"
+    except Exception as e:
+        state.warmup_status = "failed"
+        state.warmup_error = str(e)
+        print(f"Reconstruction warm-up failed: {e}")
+    finally:
+        state.warmup_seconds = round(time.monotonic() - started, 3)
+
+if __name__ == "__main__":
+    # Schema management as a deploy step: python -m src.core.lifecycle
+    AUTO_CREATE_SCHEMA = True
+    init_schema()
+    print("Schema created.")
@@ -0,0 +1,41 @@
+import threading
+from typing import Dict
+
+class MetricsRegistry:
+    """
+    In-process counters, gauges and timing summaries (count / total / max), exposed as JSON
+    by /api/stats/metrics. Values are per process and reset on restart.
+    """
+    def __init__(self):
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+        self._summaries: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def set_gauge(self, name: str, value: float) -> None:
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            summary = self._summaries.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+            summary["count"] += 1
+            summary["total"] += value
+            summary["max"] = max(summary["max"], value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "summaries": {
+                    name: {**summary, "avg": summary["total"] / summary["count"]}
+                    for name, summary in self._summaries.items()
+                },
+            }
+
+metrics = MetricsRegistry()
@@ -0,0 +1,40 @@
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, Request, Response
+
+# Keyset cursor: the (created_at, id) of the last row of the previous page
+Cursor = Tuple[datetime, int]
+
+MAX_PAGE_SIZE = 1000
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Cursor]:
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+def paginate(rows: list, limit: int, request: Request, response: Response) -> list:
+    """
+    Trims a 'limit + 1' result to 'limit' rows and, when there is a next page,
+    advertises it through the 'Link: <...>; rel="next"' and 'X-Next-Cursor' headers.
+    """
+    if len(rows) <= limit:
+        return rows
+
+    rows = rows[:limit]
+    last = rows[-1]
+    next_cursor = encode_cursor(last.created_at, last.id)
+    next_url = request.url.remove_query_params("skip").include_query_params(cursor=next_cursor)
+    response.headers["Link"] = f'<{next_url}>; rel="next"'
+    response.headers["X-Next-Cursor"] = next_cursor
+    return rows
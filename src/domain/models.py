@@ -1,13 +1,26 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, Float, String, DateTime, ForeignKey, Index, UniqueConstraint
+from sqlalchemy.dialects.sqlite import DATETIME as SQLITE_DATETIME
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..core.database import Base
 
+# SQLite stores CURRENT_TIMESTAMP without fractional seconds; binding parameters in the
+# same format keeps comparisons against created_at (keyset cursors) exact on dev databases.
+Timestamp = DateTime(timezone=True).with_variant(
+    SQLITE_DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"),
+    "sqlite",
+)
+
 class Part(Base):
     """
     Represents a standard part in the system, used as a reference for quality control.
     """
     __tablename__ = "parts"
+    __table_args__ = (
+        # Keyset pagination of the catalog filtered by type
+        Index("ix_parts_type_created_id", "part_type", "created_at", "id"),
+        Index("ix_parts_created_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), nullable=False)
@@ -18,11 +31,12 @@ class Part(Base):
     model_3d_url = Column(String(255), nullable=False, default="./examples/key.stl")
     part_type = Column(String(50), nullable=False, default="reference") # 'reference' or 'sample'
 
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    created_at = Column(Timestamp, server_default=func.now())
+    updated_at = Column(Timestamp, onupdate=func.now())
 
     # This creates a link to easily access all comparison jobs associated with this part.
-    comparison_jobs = relationship("ComparisonJob", back_populates="part")
+    # The database deletes them with the part (ON DELETE CASCADE) instead of the ORM nulling part_id
+    comparison_jobs = relationship("ComparisonJob", back_populates="part", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class ComparisonJob(Base):
@@ -31,6 +45,12 @@ class ComparisonJob(Base):
     and compare it against a standard part.
     """
     __tablename__ = "comparison_jobs"
+    __table_args__ = (
+        # Keyset pagination of a part's history, optionally filtered by status
+        Index("ix_jobs_part_created_id", "part_id", "created_at", "id"),
+        Index("ix_jobs_part_status_created_id", "part_id", "status", "created_at", "id"),
+        Index("ix_jobs_status_created", "status", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
 
@@ -42,8 +62,84 @@ class ComparisonJob(Base):
     input_front_image_url = Column(String(255), nullable=False)
     output_model_url = Column(String(255), nullable=True)
 
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    created_at = Column(Timestamp, server_default=func.now())
+    updated_at = Column(Timestamp, onupdate=func.now())
 
     # This creates a link back to the Part object.
-    part = relationship("Part", back_populates="comparison_jobs")
\ No newline at end of file
+    part = relationship("Part", back_populates="comparison_jobs")
+    # Loaded with the job (one IN query per page of jobs), removed with it by the database
+    segmentation = relationship("ComparisonJobSegmentation", lazy="selectin", cascade="all, delete-orphan", passive_deletes=True)
+
+class DashboardCounter(Base):
+    """
+    Holds a pre-aggregated dashboard counter, maintained incrementally by the
+    repositories so the stats endpoint never has to scan the job history.
+    """
+    __tablename__ = "dashboard_counters"
+
+    name = Column(String(50), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+    updated_at = Column(Timestamp, server_default=func.now(), onupdate=func.now())
+
+
+class StoredBlob(Base):
+    """
+    Reference-counted index of content-addressed uploads, so identical files are
+    stored once and released when the last record pointing at them goes away.
+    """
+    __tablename__ = "stored_blobs"
+
+    # Storage key derived from the content digest (relative path or Cloudinary public_id)
+    key = Column(String(255), primary_key=True)
+    url = Column(String(255), nullable=False, index=True)
+    ref_count = Column(Integer, nullable=False, default=1)
+
+    created_at = Column(Timestamp, server_default=func.now())
+
+
+class ImageDerivative(Base):
+    """
+    A downscaled copy of an uploaded image (working copy or preview), generated once at
+    upload time so workers and clients do not have to decode the full-resolution original.
+    """
+    __tablename__ = "image_derivatives"
+    __table_args__ = (
+        UniqueConstraint("original_url", "kind", name="uq_image_derivatives_original_kind"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    original_url = Column(String(255), nullable=False, index=True)
+    kind = Column(String(20), nullable=False) # 'work' or 'preview'
+    url = Column(String(255), nullable=False)
+    width = Column(Integer, nullable=False)
+    height = Column(Integer, nullable=False)
+
+    created_at = Column(Timestamp, server_default=func.now())
+
+
+class ComparisonJobView(Base):
+    """
+    One calibrated input image of a multi-view comparison job (angle around the turntable axis).
+    """
+    __tablename__ = "comparison_job_views"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, ForeignKey("comparison_jobs.id", ondelete="CASCADE"), nullable=False, index=True)
+    position = Column(Integer, nullable=False)
+    angle = Column(Float, nullable=False)
+    axis_x = Column(Float, nullable=True) # turntable axis column, as a fraction of the image width
+    image_url = Column(String(255), nullable=False)
+
+
+class ComparisonJobSegmentation(Base):
+    """
+    Which segmentation path produced the mask of each view of a comparison job
+    ('classical', 'rembg', 'rembg_fallback', ...), recorded when the job completes.
+    """
+    __tablename__ = "comparison_job_segmentations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, ForeignKey("comparison_jobs.id", ondelete="CASCADE"), nullable=False, index=True)
+    view = Column(String(20), nullable=False) # 'front', 'side' or the turntable angle of the view
+    path = Column(String(50), nullable=False)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Dict, Optional, List
 from datetime import datetime
 
 # Schemas for the Part model
@@ -31,10 +31,19 @@ class ComparisonJobBase(BaseModel):
 class ComparisonJobCreate(ComparisonJobBase):
     pass
 
+class JobSegmentation(BaseModel):
+    view: str
+    path: str
+
+    class Config:
+        from_attributes = True
+
 class ComparisonJob(ComparisonJobBase):
     id: int
     status: str
     output_model_url: Optional[str] = None
+    # Segmentation path taken by each view, once the job completed
+    segmentation: List[JobSegmentation] = []
     created_at: datetime
     updated_at: Optional[datetime] = None
 
@@ -48,6 +57,7 @@ class JobResponse(BaseModel):
 class JobStatusResponse(BaseModel):
     status: str
     modelUrl: Optional[str] = None
+    segmentation: Dict[str, str] = {}
 
 class DashboardStats(BaseModel):
     totalParts: int
@@ -66,4 +76,28 @@ class DefectBox(BaseModel):
 class DefectAnalysisResponse(BaseModel):
     total_defects: int
     image_dimensions: dict
-    defects: List[DefectBox]
\ No newline at end of file
+    defects: List[DefectBox]
+
+class BulkImportSkipped(BaseModel):
+    sku: str
+    reason: str
+
+class BulkImportResponse(BaseModel):
+    created: List[Part]
+    skipped: List[BulkImportSkipped]
+
+class ImageDerivative(BaseModel):
+    original_url: str
+    kind: str
+    url: str
+    width: int
+    height: int
+
+    class Config:
+        from_attributes = True
+
+class ComparisonJobViewCreate(BaseModel):
+    position: int
+    angle: float
+    axis_x: Optional[float] = None
+    image_url: str
@@ -1,16 +1,84 @@
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+import asyncio
 import os
+import random
+import traceback
 
-from .domain import models
-from .core.database import engine
-from .routers import parts, comparison, analysis, stats
+from .core.lifecycle import init_schema, warm_up_reconstruction
+from .routers import parts, comparison, analysis, stats, export, health
+from .workers.tasks import collect_orphan_uploads, fail_interrupted_jobs, reconcile_dashboard_stats
+from .workers.scheduler import scheduler
 
-# Create tables if they don't exist
-models.Base.metadata.create_all(bind=engine)
+# Seconds between full recounts of the dashboard counters (0 disables the periodic run)
+STATS_RECONCILE_INTERVAL = float(os.getenv("STATS_RECONCILE_INTERVAL", "3600"))
+# Seconds between garbage collections of uploads/ (0 disables them)
+UPLOADS_GC_INTERVAL = float(os.getenv("UPLOADS_GC_INTERVAL", "21600"))
+# Backoff between schema creation attempts while the database is unreachable, doubling up to the max
+SCHEMA_RETRY_SECONDS = float(os.getenv("SCHEMA_RETRY_SECONDS", "1"))
+SCHEMA_RETRY_MAX_SECONDS = float(os.getenv("SCHEMA_RETRY_MAX_SECONDS", "60"))
+# Seconds shutdown waits for the cancelled startup task to end
+STARTUP_CANCEL_TIMEOUT = float(os.getenv("STARTUP_CANCEL_TIMEOUT", "5"))
 
-app = FastAPI()
+async def reconcile_stats_periodically():
+    while True:
+        await run_in_threadpool(reconcile_dashboard_stats)
+        if STATS_RECONCILE_INTERVAL <= 0:
+            return
+        await asyncio.sleep(STATS_RECONCILE_INTERVAL)
+
+async def collect_uploads_periodically():
+    # Waits one interval (plus jitter, so processes started together spread out) before the first
+    # walk of uploads/, keeping the disk free during startup; a file lock skips concurrent runs
+    if UPLOADS_GC_INTERVAL <= 0:
+        return
+    await asyncio.sleep(UPLOADS_GC_INTERVAL * random.uniform(1, 1.1))
+    while True:
+        await run_in_threadpool(collect_orphan_uploads)
+        await asyncio.sleep(UPLOADS_GC_INTERVAL)
+
+async def init_schema_with_retry():
+    # /health/ready keeps failing until this succeeds, and the database loops wait for it
+    delay = SCHEMA_RETRY_SECONDS
+    while True:
+        try:
+            await run_in_threadpool(init_schema)
+            return
+        except Exception:
+            traceback.print_exc()
+            print(f"Schema initialization failed, retrying in {delay:g}s")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, SCHEMA_RETRY_MAX_SECONDS)
+
+async def run_startup():
+    # Runs after the server starts accepting requests; /health/ready reports progress
+    warmup_task = asyncio.create_task(run_in_threadpool(warm_up_reconstruction))
+    await init_schema_with_retry()
+    # Before the first reconcile, so activeComparisons no longer counts the jobs nobody will finish
+    await run_in_threadpool(fail_interrupted_jobs)
+    await asyncio.gather(reconcile_stats_periodically(), collect_uploads_periodically(), warmup_task)
+
+def report_startup_failure(task: asyncio.Task):
+    # The startup task is not awaited while the app runs; surface its failure when it happens
+    error = None if task.cancelled() else task.exception()
+    if error is not None:
+        traceback.print_exception(type(error), error, error.__traceback__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup_task = asyncio.create_task(run_startup())
+    startup_task.add_done_callback(report_startup_failure)
+    yield
+    startup_task.cancel()
+    # A step running in the threadpool only stops once its call returns; do not hold shutdown for it
+    await asyncio.wait({startup_task}, timeout=STARTUP_CANCEL_TIMEOUT)
+    # Waits for running reconstructions off the event loop
+    await run_in_threadpool(scheduler.shutdown)
+
+app = FastAPI(lifespan=lifespan)
 
 # Static Folders Configuration
 os.makedirs("static/images", exist_ok=True)
@@ -32,10 +100,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"], 
+    expose_headers=["ETag", "Link", "X-Next-Cursor"],
 )
 
 # Include Routers
 app.include_router(parts.router)
 app.include_router(comparison.router)
 app.include_router(analysis.router)
-app.include_router(stats.router)
\ No newline at end of file
+app.include_router(stats.router)
+app.include_router(export.router)
+app.include_router(health.router)
\ No newline at end of file
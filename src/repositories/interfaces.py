@@ -1,5 +1,10 @@
-from typing import Protocol, List, Optional, runtime_checkable
+from typing import Dict, Protocol, Iterable, Iterator, List, Optional, Set, Tuple, runtime_checkable
+from datetime import datetime
 from ..domain import schemas, models
+from ..core.pagination import Cursor
+
+class DuplicateSkuError(ValueError):
+    """Raised by part writers when a SKU is already registered (e.g. by a concurrent request)."""
 
 # --- Part Interfaces ---
 
@@ -11,7 +16,18 @@ class IPartReader(Protocol):
     def get_part_by_sku(self, sku: str) -> Optional[models.Part]:
         ...
 
-    def get_parts(self, skip: int = 0, limit: int = 100) -> List[models.Part]:
+    def get_existing_skus(self, skus: Iterable[str]) -> Set[str]:
+        ...
+
+    def get_parts(self, skip: int = 0, limit: int = 100, part_type: Optional[str] = None,
+                  cursor: Optional[Cursor] = None, created_after: Optional[datetime] = None,
+                  created_before: Optional[datetime] = None) -> List[models.Part]:
+        ...
+
+@runtime_checkable
+class IPartExporter(Protocol):
+    def iter_parts(self, part_type: Optional[str] = None, created_after: Optional[datetime] = None,
+                   created_before: Optional[datetime] = None, batch_size: int = 1000) -> Iterator[dict]:
         ...
 
 @runtime_checkable
@@ -19,11 +35,14 @@ class IPartWriter(Protocol):
     def create_part(self, part: schemas.PartCreate) -> models.Part:
         ...
 
+    def create_parts(self, parts: List[schemas.PartCreate]) -> List[models.Part]:
+        ...
+
     def delete_part(self, part_id: int) -> Optional[models.Part]:
         ...
 
 @runtime_checkable
-class IPartRepository(IPartReader, IPartWriter, Protocol):
+class IPartRepository(IPartReader, IPartExporter, IPartWriter, Protocol):
     """
     Full repository interface combining read and write operations.
     """
@@ -38,21 +57,41 @@ class IJobRetriever(Protocol):
 
 @runtime_checkable
 class IJobSearcher(Protocol):
-    def get_jobs_by_part(self, part_id: int) -> List[models.ComparisonJob]:
+    def get_jobs_by_part(self, part_id: int, limit: int = 100, cursor: Optional[Cursor] = None,
+                         status: Optional[str] = None, created_after: Optional[datetime] = None,
+                         created_before: Optional[datetime] = None) -> List[models.ComparisonJob]:
+        ...
+
+    def get_input_urls_by_part(self, part_id: int) -> List[str]:
+        ...
+
+@runtime_checkable
+class IJobExporter(Protocol):
+    def iter_jobs(self, part_id: Optional[int] = None, status: Optional[str] = None,
+                  created_after: Optional[datetime] = None, created_before: Optional[datetime] = None,
+                  batch_size: int = 1000) -> Iterator[dict]:
         ...
 
 @runtime_checkable
 class IJobCreator(Protocol):
-    def create_job(self, job: schemas.ComparisonJobCreate) -> models.ComparisonJob:
+    def create_job(self, job: schemas.ComparisonJobCreate,
+                   views: Optional[List[schemas.ComparisonJobViewCreate]] = None) -> models.ComparisonJob:
         ...
 
 @runtime_checkable
 class IJobUpdater(Protocol):
-    def update_job_status(self, job_id: int, status: str, output_url: Optional[str] = None) -> Optional[models.ComparisonJob]:
+    def update_job_status(self, job_id: int, status: str, output_url: Optional[str] = None,
+                          only_if_active: bool = False) -> Optional[models.ComparisonJob]:
+        ...
+
+    def add_segmentation_report(self, job_id: int, report: Dict[str, str]) -> None:
+        ...
+
+    def fail_stale_jobs(self, older_than_seconds: float) -> int:
         ...
 
 @runtime_checkable
-class IJobRepository(IJobRetriever, IJobSearcher, IJobCreator, IJobUpdater, Protocol):
+class IJobRepository(IJobRetriever, IJobSearcher, IJobExporter, IJobCreator, IJobUpdater, Protocol):
     """
     Full repository interface combining all job operations.
     """
@@ -66,8 +105,41 @@ class IStatsReader(Protocol):
         ...
 
 @runtime_checkable
-class IStatsRepository(IStatsReader, Protocol):
+class IStatsMaintainer(Protocol):
+    def reconcile_counters(self) -> dict:
+        ...
+
+@runtime_checkable
+class IStatsRepository(IStatsReader, IStatsMaintainer, Protocol):
     """
     Full repository interface for stats.
     """
     ...
+
+# --- Image Derivative Interfaces ---
+
+@runtime_checkable
+class IDerivativeRepository(Protocol):
+    def get_derivatives(self, original_urls: Iterable[str]) -> List[models.ImageDerivative]:
+        ...
+
+    def add_derivatives(self, derivatives: List[schemas.ImageDerivative]) -> List[schemas.ImageDerivative]:
+        """Returns the derivatives not added because another upload registered them first."""
+        ...
+
+    def delete_derivatives(self, original_urls: Iterable[str]) -> None:
+        ...
+
+# --- Stored File Interfaces ---
+
+@runtime_checkable
+class IFileReferenceRepository(Protocol):
+    def iter_referenced_urls(self, expired_before: Optional[datetime] = None, changed_since: Optional[datetime] = None,
+                             batch_size: int = 1000) -> Iterator[str]:
+        ...
+
+    def iter_derivative_urls(self, batch_size: int = 1000) -> Iterator[Tuple[str, str]]:
+        ...
+
+    def forget_files(self, keys: List[str], urls: List[str]) -> None:
+        ...
@@ -1,7 +1,96 @@
+from sqlalchemy import and_, case, delete, func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 from ..domain import models, schemas
-from .interfaces import IPartRepository, IJobRepository, IStatsRepository
+from ..core.pagination import Cursor
+from .interfaces import DuplicateSkuError, IPartRepository, IJobRepository, IStatsRepository
+
+# Upper bound for IN (...) lists and executemany batches
+BULK_CHUNK_SIZE = 500
+
+# Jobs in these statuses count as "active comparisons" on the dashboard; every other status
+# (COMPLETE, FAILED, CANCELLED, TIMED_OUT, APPROVED, REJECTED) is final for the worker
+ACTIVE_JOB_STATUSES = ("PENDING", "PROCESSING")
+
+# Jobs that ended without a model; their inputs are only kept for a retention period
+UNSUCCESSFUL_JOB_STATUSES = ("FAILED", "CANCELLED", "TIMED_OUT")
+
+# Names of the rows kept in the dashboard_counters table
+COUNTER_TOTAL_PARTS = "totalParts"
+COUNTER_TOTAL_ANALYSES = "totalAnalyses"
+COUNTER_ACTIVE_COMPARISONS = "activeComparisons"
+DASHBOARD_COUNTERS = (COUNTER_TOTAL_PARTS, COUNTER_TOTAL_ANALYSES, COUNTER_ACTIVE_COMPARISONS)
+
+def is_active_status(status: Optional[str]) -> bool:
+    return bool(status) and status.upper() in ACTIVE_JOB_STATUSES
+
+def count_active_jobs():
+    # SUM(CASE ...) instead of COUNT(...) FILTER, which MySQL does not support
+    return func.coalesce(func.sum(case(
+        (func.upper(models.ComparisonJob.status).in_(ACTIVE_JOB_STATUSES), 1), else_=0
+    )), 0)
+
+def seed_counters(db: Session, names: Iterable[str] = DASHBOARD_COUNTERS) -> None:
+    """
+    Inserts the missing dashboard counter rows at 0 (reconcile_counters sets their real value),
+    so writers always have a row to bump and reconcile always has a row to lock.
+    """
+    for name in names:
+        try:
+            with db.begin_nested():
+                db.add(models.DashboardCounter(name=name, value=0))
+        except IntegrityError:
+            # Already there, or another writer seeded it first
+            pass
+
+def bump_counters(db: Session, deltas: Dict[str, int]) -> None:
+    """
+    Applies relative changes to the dashboard counters inside the caller's transaction.
+    Uses 'value = value + delta' so concurrent writers never lose updates.
+    A missing row is seeded first, so a write racing startup is not lost.
+    """
+    for name, delta in deltas.items():
+        if delta:
+            increment = (
+                update(models.DashboardCounter)
+                .where(models.DashboardCounter.name == name)
+                .values(value=models.DashboardCounter.value + delta)
+            )
+            if db.execute(increment).rowcount == 0:
+                seed_counters(db, [name])
+                db.execute(increment)
+
+def keyset_page(query, model, limit: int, cursor: Optional[Cursor] = None,
+                created_after: Optional[datetime] = None, created_before: Optional[datetime] = None):
+    """
+    Newest-first keyset pagination on (created_at, id), backed by the composite indexes on the models.
+    Unlike OFFSET, the cost of a page does not depend on how deep the client has paged.
+    """
+    if created_after:
+        query = query.filter(model.created_at >= created_after)
+    if created_before:
+        query = query.filter(model.created_at < created_before)
+    if cursor:
+        last_created_at, last_id = cursor
+        query = query.filter(or_(
+            model.created_at < last_created_at,
+            and_(model.created_at == last_created_at, model.id < last_id),
+        ))
+    return query.order_by(model.created_at.desc(), model.id.desc()).limit(limit)
+
+def stream_rows(db: Session, statement, batch_size: int) -> Iterator[dict]:
+    """
+    Yields plain row dicts through a server-side cursor, fetching 'batch_size' rows at a time.
+    No ORM objects are built, so memory stays flat whatever the number of rows.
+    """
+    result = db.execute(statement.execution_options(stream_results=True, yield_per=batch_size))
+    try:
+        for row in result.mappings():
+            yield dict(row)
+    finally:
+        result.close()
 
 class SqlAlchemyPartRepository:
     def __init__(self, db: Session):
@@ -13,23 +102,99 @@ class SqlAlchemyPartRepository:
     def get_part_by_sku(self, sku: str) -> Optional[models.Part]:
         return self.db.query(models.Part).filter(models.Part.sku == sku).first()
 
-    def get_parts(self, skip: int = 0, limit: int = 100, part_type: Optional[str] = None) -> List[models.Part]:
+    def get_existing_skus(self, skus: Iterable[str]) -> Set[str]:
+        skus = list(skus)
+        existing = set()
+        for start in range(0, len(skus), BULK_CHUNK_SIZE):
+            chunk = skus[start:start + BULK_CHUNK_SIZE]
+            existing.update(self.db.scalars(select(models.Part.sku).where(models.Part.sku.in_(chunk))))
+        return existing
+
+    def get_parts(self, skip: int = 0, limit: int = 100, part_type: Optional[str] = None,
+                  cursor: Optional[Cursor] = None, created_after: Optional[datetime] = None,
+                  created_before: Optional[datetime] = None) -> List[models.Part]:
         query = self.db.query(models.Part)
         if part_type:
             query = query.filter(models.Part.part_type == part_type)
-        return query.offset(skip).limit(limit).all()
+        query = keyset_page(query, models.Part, limit, cursor, created_after, created_before)
+        if skip and not cursor:
+            # Legacy offset paging, kept for older clients
+            query = query.offset(skip)
+        return query.all()
+
+    def iter_parts(self, part_type: Optional[str] = None, created_after: Optional[datetime] = None,
+                   created_before: Optional[datetime] = None, batch_size: int = 1000) -> Iterator[dict]:
+        table = models.Part.__table__
+        statement = select(*table.columns).order_by(table.c.id)
+        if part_type:
+            statement = statement.where(table.c.part_type == part_type)
+        if created_after:
+            statement = statement.where(table.c.created_at >= created_after)
+        if created_before:
+            statement = statement.where(table.c.created_at < created_before)
+        return stream_rows(self.db, statement, batch_size)
 
     def create_part(self, part: schemas.PartCreate) -> models.Part:
         db_part = models.Part(**part.model_dump())
-        self.db.add(db_part)
-        self.db.commit()
+        try:
+            self.db.add(db_part)
+            bump_counters(self.db, {COUNTER_TOTAL_PARTS: 1})
+            self.db.commit()
+        except IntegrityError:
+            # Leave the session usable for the caller's cleanup
+            self.db.rollback()
+            raise DuplicateSkuError(f"SKU '{part.sku}' já cadastrado.")
         self.db.refresh(db_part)
         return db_part
 
+    def create_parts(self, parts: List[schemas.PartCreate]) -> List[models.Part]:
+        """
+        Inserts many parts with batched executemany statements in a single transaction.
+        Returns the created parts in the order of 'parts'.
+        """
+        rows = [part.model_dump() for part in parts]
+        try:
+            for start in range(0, len(rows), BULK_CHUNK_SIZE):
+                self.db.execute(insert(models.Part), rows[start:start + BULK_CHUNK_SIZE])
+            bump_counters(self.db, {COUNTER_TOTAL_PARTS: len(rows)})
+            self.db.commit()
+        except SQLAlchemyError as e:
+            # Nothing was inserted; leave the session usable for the caller's cleanup
+            self.db.rollback()
+            if isinstance(e, IntegrityError):
+                raise DuplicateSkuError("Um ou mais SKUs já foram cadastrados.")
+            raise
+
+        skus = [row["sku"] for row in rows]
+        created = []
+        for start in range(0, len(skus), BULK_CHUNK_SIZE):
+            chunk = skus[start:start + BULK_CHUNK_SIZE]
+            created.extend(self.db.query(models.Part).filter(models.Part.sku.in_(chunk)).all())
+        position = {sku: i for i, sku in enumerate(skus)}
+        return sorted(created, key=lambda part: position[part.sku])
+
     def delete_part(self, part_id: int) -> Optional[models.Part]:
         db_part = self.get_part(part_id)
         if db_part:
+            # Jobs go away with the part, so release their counters too
+            total_jobs, active_jobs = self.db.query(
+                func.count(models.ComparisonJob.id),
+                count_active_jobs(),
+            ).filter(models.ComparisonJob.part_id == part_id).one()
+            # Deleted explicitly as well as by ON DELETE CASCADE, which tables created
+            # before the cascade was declared (or SQLite without foreign keys) do not have
+            job_ids = select(models.ComparisonJob.id).where(models.ComparisonJob.part_id == part_id)
+            for child in (models.ComparisonJobView, models.ComparisonJobSegmentation):
+                self.db.execute(delete(child).where(child.job_id.in_(job_ids))
+                                .execution_options(synchronize_session=False))
+            self.db.execute(delete(models.ComparisonJob).where(models.ComparisonJob.part_id == part_id)
+                            .execution_options(synchronize_session=False))
             self.db.delete(db_part)
+            bump_counters(self.db, {
+                COUNTER_TOTAL_PARTS: -1,
+                COUNTER_TOTAL_ANALYSES: -total_jobs,
+                COUNTER_ACTIVE_COMPARISONS: -active_jobs,
+            })
             self.db.commit()
             return db_part
         return None
@@ -41,17 +206,54 @@ class SqlAlchemyJobRepository:
     def get_job(self, job_id: int) -> Optional[models.ComparisonJob]:
         return self.db.query(models.ComparisonJob).filter(models.ComparisonJob.id == job_id).first()
 
-    def create_job(self, job: schemas.ComparisonJobCreate) -> models.ComparisonJob:
+    def create_job(self, job: schemas.ComparisonJobCreate,
+                   views: Optional[List[schemas.ComparisonJobViewCreate]] = None) -> models.ComparisonJob:
+        """Creates the job and, for a multi-view job, its views in one transaction."""
         db_job = models.ComparisonJob(**job.model_dump())
-        self.db.add(db_job)
-        self.db.commit()
+        try:
+            self.db.add(db_job)
+            self.db.flush()
+            if views:
+                self.db.execute(insert(models.ComparisonJobView),
+                                [{"job_id": db_job.id, **view.model_dump()} for view in views])
+            bump_counters(self.db, {
+                COUNTER_TOTAL_ANALYSES: 1,
+                COUNTER_ACTIVE_COMPARISONS: 1 if is_active_status(db_job.status) else 0,
+            })
+            self.db.commit()
+        except SQLAlchemyError:
+            # Leave the session usable for the caller's cleanup
+            self.db.rollback()
+            raise
         self.db.refresh(db_job)
         return db_job
 
-    def update_job_status(self, job_id: int, status: str, output_url: Optional[str] = None) -> Optional[models.ComparisonJob]:
-        db_job = self.get_job(job_id)
+    def add_segmentation_report(self, job_id: int, report: Dict[str, str]) -> None:
+        if report:
+            self.db.execute(insert(models.ComparisonJobSegmentation),
+                            [{"job_id": job_id, "view": view, "path": path} for view, path in report.items()])
+            self.db.commit()
+
+    def update_job_status(self, job_id: int, status: str, output_url: Optional[str] = None,
+                          only_if_active: bool = False) -> Optional[models.ComparisonJob]:
+        """
+        With 'only_if_active' the row is locked and left untouched unless the job is still pending
+        or processing, so a job cancelled or timed out meanwhile keeps that status.
+        """
+        if only_if_active:
+            db_job = (self.db.query(models.ComparisonJob).filter(models.ComparisonJob.id == job_id)
+                      .with_for_update().populate_existing().first())
+            if db_job and not is_active_status(db_job.status):
+                self.db.commit()
+                return db_job
+        else:
+            db_job = self.get_job(job_id)
         if db_job:
+            was_active = is_active_status(db_job.status)
             db_job.status = status
+            bump_counters(self.db, {
+                COUNTER_ACTIVE_COMPARISONS: int(is_active_status(status)) - int(was_active),
+            })
             if output_url:
                 db_job.output_model_url = output_url
             self.db.commit()
@@ -59,24 +261,283 @@ class SqlAlchemyJobRepository:
             return db_job
         return None
 
-    def get_jobs_by_part(self, part_id: int) -> List[models.ComparisonJob]:
-        return self.db.query(models.ComparisonJob).filter(models.ComparisonJob.part_id == part_id).all()
+    def fail_stale_jobs(self, older_than_seconds: float) -> int:
+        """
+        Marks FAILED the jobs created more than 'older_than_seconds' ago that are still pending or
+        processing, left behind by a process that died without finishing them. Age is measured on
+        the database clock, the one that stamps created_at. Returns how many were failed.
+        """
+        # Whole seconds, since SQLite stores created_at without fractions
+        created_before = (self.db.scalar(select(func.now())) - timedelta(seconds=older_than_seconds)).replace(microsecond=0)
+        # Lock the counter row first, like reconcile_counters, so the decrement matches the update
+        self.db.query(models.DashboardCounter).filter(
+            models.DashboardCounter.name == COUNTER_ACTIVE_COMPARISONS
+        ).with_for_update().all()
+        failed = self.db.execute(
+            update(models.ComparisonJob)
+            .where(func.upper(models.ComparisonJob.status).in_(ACTIVE_JOB_STATUSES),
+                   models.ComparisonJob.created_at < created_before)
+            .values(status="FAILED")
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        bump_counters(self.db, {COUNTER_ACTIVE_COMPARISONS: -failed})
+        self.db.commit()
+        return failed
+
+    def get_input_urls_by_part(self, part_id: int) -> List[str]:
+        """
+        Uploaded inputs of every job of a part, once per stored reference: the views of a
+        multi-view job (its front/side columns repeat the first two), else its front and side.
+        """
+        jobs = (self.db.query(models.ComparisonJob.id, models.ComparisonJob.input_front_image_url,
+                              models.ComparisonJob.input_side_image_url)
+                .filter(models.ComparisonJob.part_id == part_id).all())
+        views: Dict[int, List[str]] = {}
+        rows = (self.db.query(models.ComparisonJobView.job_id, models.ComparisonJobView.image_url)
+                .join(models.ComparisonJob, models.ComparisonJobView.job_id == models.ComparisonJob.id)
+                .filter(models.ComparisonJob.part_id == part_id).all())
+        for job_id, url in rows:
+            views.setdefault(job_id, []).append(url)
+
+        urls = []
+        for job_id, front_url, side_url in jobs:
+            urls.extend(views.get(job_id) or [front_url, side_url])
+        return urls
+
+    def get_jobs_by_part(self, part_id: int, limit: int = 100, cursor: Optional[Cursor] = None,
+                         status: Optional[str] = None, created_after: Optional[datetime] = None,
+                         created_before: Optional[datetime] = None) -> List[models.ComparisonJob]:
+        query = self.db.query(models.ComparisonJob).filter(models.ComparisonJob.part_id == part_id)
+        if status:
+            # New jobs are created with a lowercase 'pending', every later status is uppercase
+            query = query.filter(models.ComparisonJob.status.in_({status.upper(), status.lower()}))
+        return keyset_page(query, models.ComparisonJob, limit, cursor, created_after, created_before).all()
+
+    def iter_jobs(self, part_id: Optional[int] = None, status: Optional[str] = None,
+                  created_after: Optional[datetime] = None, created_before: Optional[datetime] = None,
+                  batch_size: int = 1000) -> Iterator[dict]:
+        table = models.ComparisonJob.__table__
+        statement = select(*table.columns).order_by(table.c.id)
+        if part_id is not None:
+            statement = statement.where(table.c.part_id == part_id)
+        if status:
+            statement = statement.where(table.c.status.in_({status.upper(), status.lower()}))
+        if created_after:
+            statement = statement.where(table.c.created_at >= created_after)
+        if created_before:
+            statement = statement.where(table.c.created_at < created_before)
+        return stream_rows(self.db, statement, batch_size)
 
 class SqlAlchemyStatsRepository:
     def __init__(self, db: Session):
         self.db = db
 
     def get_dashboard_stats(self) -> dict:
-        total_parts = self.db.query(models.Part).count()
-        total_analyses = self.db.query(models.ComparisonJob).count()
-        
-        # Assuming 'active' jobs are those with 'PENDING' or 'PROCESSING' status
-        active_comparisons = self.db.query(models.ComparisonJob).filter(
-            models.ComparisonJob.status.in_(['PENDING', 'PROCESSING'])
-        ).count()
-
-        return {
-            "totalParts": total_parts,
-            "totalAnalyses": total_analyses,
-            "activeComparisons": active_comparisons,
+        # O(1): reads the pre-aggregated counters instead of counting the tables
+        rows = self.db.query(models.DashboardCounter).filter(
+            models.DashboardCounter.name.in_(DASHBOARD_COUNTERS)
+        ).all()
+        counters = {row.name: row.value for row in rows}
+
+        if len(counters) < len(DASHBOARD_COUNTERS):
+            counters = self.reconcile_counters()
+
+        return {name: counters[name] for name in DASHBOARD_COUNTERS}
+
+    def reconcile_counters(self) -> dict:
+        """
+        Recomputes every counter from the source tables and stores the result.
+        This is the only place that scans the tables; call it rarely (startup / periodic job).
+        """
+        # Lock the counter rows first so writers wait for us instead of being lost in between
+        self.db.query(models.DashboardCounter).with_for_update().all()
+
+        total_parts = self.db.query(func.count(models.Part.id)).scalar()
+        total_analyses = self.db.query(func.count(models.ComparisonJob.id)).scalar()
+        active_comparisons = self.db.query(count_active_jobs()).scalar()
+
+        counters = {
+            COUNTER_TOTAL_PARTS: total_parts,
+            COUNTER_TOTAL_ANALYSES: total_analyses,
+            COUNTER_ACTIVE_COMPARISONS: active_comparisons,
         }
+        for name, value in counters.items():
+            self.db.merge(models.DashboardCounter(name=name, value=value))
+        self.db.commit()
+        return counters
+
+
+class SqlAlchemyDerivativeRepository:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get_derivatives(self, original_urls: Iterable[str]) -> List[models.ImageDerivative]:
+        original_urls = list(original_urls)
+        derivatives = []
+        for start in range(0, len(original_urls), BULK_CHUNK_SIZE):
+            chunk = original_urls[start:start + BULK_CHUNK_SIZE]
+            derivatives.extend(
+                self.db.query(models.ImageDerivative).filter(models.ImageDerivative.original_url.in_(chunk)).all()
+            )
+        return derivatives
+
+    def delete_derivatives(self, original_urls: Iterable[str]) -> None:
+        original_urls = list(original_urls)
+        for start in range(0, len(original_urls), BULK_CHUNK_SIZE):
+            chunk = original_urls[start:start + BULK_CHUNK_SIZE]
+            self.db.execute(delete(models.ImageDerivative).where(models.ImageDerivative.original_url.in_(chunk)))
+        self.db.commit()
+
+    def add_derivatives(self, derivatives: List[schemas.ImageDerivative]) -> List[schemas.ImageDerivative]:
+        """Returns the derivatives left out because a row for their (original_url, kind) already exists."""
+        if not derivatives:
+            return []
+        try:
+            self.db.execute(insert(models.ImageDerivative), [derivative.model_dump() for derivative in derivatives])
+            self.db.commit()
+            return []
+        except IntegrityError:
+            # A concurrent upload of the same content registered some of them first
+            self.db.rollback()
+        rejected = []
+        for derivative in derivatives:
+            try:
+                self.db.execute(insert(models.ImageDerivative), [derivative.model_dump()])
+                self.db.commit()
+            except IntegrityError:
+                self.db.rollback()
+                rejected.append(derivative)
+        return rejected
+
+class SqlAlchemyBlobIndex:
+    """
+    Reference counts for content-addressed uploads.
+    Every call uses its own short session so storage backends can be driven from worker threads.
+    """
+    def __init__(self, session_factory: Callable[[], Session]):
+        self.session_factory = session_factory
+
+    def lookup(self, key: str) -> Optional[str]:
+        db = self.session_factory()
+        try:
+            return db.scalar(select(models.StoredBlob.url).where(models.StoredBlob.key == key))
+        finally:
+            db.close()
+
+    def acquire(self, key: str, store: Callable[[Optional[str]], str]) -> str:
+        """
+        Adds one reference to 'key'; see IBlobIndex.acquire. The increment locks an existing row
+        until commit, so 'store' cannot race release() deleting the content.
+        """
+        db = self.session_factory()
+        try:
+            increment = (
+                update(models.StoredBlob)
+                .where(models.StoredBlob.key == key)
+                .values(ref_count=models.StoredBlob.ref_count + 1)
+            )
+            while True:
+                if db.execute(increment).rowcount:
+                    url = store(db.scalar(select(models.StoredBlob.url).where(models.StoredBlob.key == key)))
+                    break
+                # No row to lock: nobody can release the content until ours is inserted
+                url = store(None)
+                try:
+                    db.add(models.StoredBlob(key=key, url=url, ref_count=1))
+                    db.flush()
+                    break
+                except IntegrityError:
+                    # Another writer registered the same blob first; take a reference to its row
+                    db.rollback()
+            db.commit()
+            return url
+        finally:
+            db.close()
+
+    def release(self, url: str, remove: Optional[Callable[[str], None]] = None) -> Optional[str]:
+        """
+        Drops one reference to the blob behind 'url'.
+        Returns its key when that was the last reference; 'remove(key)' then runs before the
+        commit, while the row is still locked, so a concurrent acquire waits for it and stores again.
+        """
+        db = self.session_factory()
+        try:
+            key = db.scalar(select(models.StoredBlob.key).where(models.StoredBlob.url == url))
+            if key is None:
+                return None
+            db.execute(
+                update(models.StoredBlob)
+                .where(models.StoredBlob.key == key, models.StoredBlob.ref_count > 0)
+                .values(ref_count=models.StoredBlob.ref_count - 1)
+            )
+            freed = db.execute(
+                delete(models.StoredBlob).where(models.StoredBlob.key == key, models.StoredBlob.ref_count <= 0)
+            ).rowcount
+            if freed and remove is not None:
+                remove(key)
+            db.commit()
+            return key if freed else None
+        finally:
+            db.close()
+
+class SqlAlchemyFileReferenceRepository:
+    """
+    Which stored files the database still points at, for the uploads garbage collector.
+    """
+    def __init__(self, db: Session):
+        self.db = db
+
+    def iter_referenced_urls(self, expired_before: Optional[datetime] = None, changed_since: Optional[datetime] = None,
+                             batch_size: int = 1000) -> Iterator[str]:
+        """
+        Every file URL held by a part, job or job view. With 'expired_before', the inputs of
+        unsuccessful jobs created before that date no longer count as references. With
+        'changed_since', only rows created or updated since then are read, in a new transaction
+        so rows committed after the last read are seen.
+        """
+        if changed_since is not None:
+            self.db.commit()
+
+        parts = models.Part.__table__
+        part_urls = select(parts.c.side_image_url, parts.c.front_image_url, parts.c.model_3d_url)
+
+        jobs = models.ComparisonJob.__table__
+        views = models.ComparisonJobView.__table__
+        job_urls = select(jobs.c.input_side_image_url, jobs.c.input_front_image_url, jobs.c.output_model_url)
+        view_urls = select(views.c.image_url).select_from(views.join(jobs, views.c.job_id == jobs.c.id))
+        if expired_before is not None:
+            kept = or_(
+                func.upper(jobs.c.status).notin_(UNSUCCESSFUL_JOB_STATUSES),
+                jobs.c.created_at >= expired_before,
+            )
+            job_urls, view_urls = job_urls.where(kept), view_urls.where(kept)
+        if changed_since is not None:
+            part_urls = part_urls.where(or_(parts.c.created_at >= changed_since, parts.c.updated_at >= changed_since))
+            changed_job = or_(jobs.c.created_at >= changed_since, jobs.c.updated_at >= changed_since)
+            job_urls, view_urls = job_urls.where(changed_job), view_urls.where(changed_job)
+
+        for statement in (part_urls, job_urls, view_urls):
+            yield from self._iter_urls(statement, batch_size)
+
+    def iter_derivative_urls(self, batch_size: int = 1000) -> Iterator[Tuple[str, str]]:
+        table = models.ImageDerivative.__table__
+        for row in stream_rows(self.db, select(table.c.original_url, table.c.url), batch_size):
+            yield row["original_url"], row["url"]
+
+    def forget_files(self, keys: List[str], urls: List[str]) -> None:
+        """Drops the blob index and derivative rows of deleted files."""
+        for start in range(0, max(len(keys), len(urls)), BULK_CHUNK_SIZE):
+            key_chunk, url_chunk = keys[start:start + BULK_CHUNK_SIZE], urls[start:start + BULK_CHUNK_SIZE]
+            if key_chunk:
+                self.db.execute(delete(models.StoredBlob).where(models.StoredBlob.key.in_(key_chunk)))
+            if url_chunk:
+                self.db.execute(delete(models.StoredBlob).where(models.StoredBlob.url.in_(url_chunk)))
+                self.db.execute(delete(models.ImageDerivative).where(or_(
+                    models.ImageDerivative.url.in_(url_chunk),
+                    models.ImageDerivative.original_url.in_(url_chunk),
+                )))
+        self.db.commit()
+
+    def _iter_urls(self, statement, batch_size: int) -> Iterator[str]:
+        for row in stream_rows(self.db, statement, batch_size):
+            yield from (url for url in row.values() if url)
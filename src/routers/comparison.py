@@ -1,9 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Optional
+from functools import partial
+import math
 from ..domain import schemas
-from ..repositories.interfaces import IJobCreator, IJobRetriever, IJobUpdater
-from ..core.dependencies import get_job_repository, get_file_storage
+from ..repositories.interfaces import IPartReader, IJobCreator, IJobRetriever, IJobUpdater, IJobRepository, IDerivativeRepository
+from ..repositories.sqlalchemy_impl import is_active_status
+from ..core.dependencies import get_part_repository, get_job_repository, get_file_storage, get_derivative_repository, get_scheduler
 from ..services.storage import IFileStorage
-from ..workers.tasks import process_job_3d_generation
+from ..services.ingest_service import ingest_images, release_images
+from ..core.cancellation import JobCancelled, cancellations
+from ..workers.tasks import drop_job, job_deadline, process_job_3d_generation, process_job_multiview_generation
+from ..workers.scheduler import JobScheduler
+
+MAX_VIEWS = 36
+
+def parse_floats(value: Optional[str], field: str) -> List[float]:
+    try:
+        numbers = [float(item) for item in value.split(",")] if value else []
+    except ValueError:
+        numbers = None
+    # float() also accepts 'nan' and 'inf', which would carve an empty volume
+    if numbers is None or not all(math.isfinite(number) for number in numbers):
+        raise HTTPException(status_code=400, detail=f"'{field}' must be a comma-separated list of numbers.")
+    return numbers
 
 router = APIRouter(
     prefix="/api/compare",
@@ -12,41 +32,122 @@ router = APIRouter(
 
 @router.post("/", response_model=schemas.ComparisonJob)
 async def create_and_run_comparison(
-    background_tasks: BackgroundTasks,
+    scheduler: JobScheduler = Depends(get_scheduler),
     job_creator: IJobCreator = Depends(get_job_repository),
+    part_reader: IPartReader = Depends(get_part_repository),
     file_storage: IFileStorage = Depends(get_file_storage),
+    derivative_repo: IDerivativeRepository = Depends(get_derivative_repository),
     reference_part_id: int = Form(...), 
     front_image: UploadFile = File(...), 
-    side_image: UploadFile = File(...)  
+    side_image: UploadFile = File(...),
+    deadline_seconds: Optional[int] = Form(None, gt=0, description="Seconds the job may take from submission before it times out")
 ):
+    # The reference part's type selects the segmentation model
+    reference_part = part_reader.get_part(reference_part_id)
+    if reference_part is None:
+        raise HTTPException(status_code=404, detail="Reference part not found")
+
     # 1. Read bytes
     front_bytes = await front_image.read()
     side_bytes = await side_image.read()
     
     # 2. Save inputs
     INPUT_DIR = "uploads/inputs"
-    # Using prefix="job" to distinguish files
-    _, front_url = file_storage.save(front_bytes, front_image.filename, INPUT_DIR, prefix="job")
-    _, side_url = file_storage.save(side_bytes, side_image.filename, INPUT_DIR, prefix="job")
-
-    # 3. Create Job PENDING
-    job_schema = schemas.ComparisonJobCreate(
-        part_id=reference_part_id,
-        input_front_image_url=front_url,
-        input_side_image_url=side_url
-    )
-    db_job = job_creator.create_job(job=job_schema)
+    saved_urls = []
+    try:
+        # Using prefix="job" to distinguish files; saving hashes and locks the blob row, so off the event loop
+        _, front_url = await run_in_threadpool(file_storage.save, front_bytes, front_image.filename, INPUT_DIR, prefix="job")
+        saved_urls.append(front_url)
+        _, side_url = await run_in_threadpool(file_storage.save, side_bytes, side_image.filename, INPUT_DIR, prefix="job")
+        saved_urls.append(side_url)
+        await run_in_threadpool(ingest_images, [(front_url, front_bytes), (side_url, side_bytes)], file_storage, derivative_repo)
+
+        # 3. Create Job PENDING
+        job_schema = schemas.ComparisonJobCreate(
+            part_id=reference_part_id,
+            input_front_image_url=front_url,
+            input_side_image_url=side_url
+        )
+        db_job = job_creator.create_job(job=job_schema)
+    except Exception:
+        # No job refers to the inputs saved so far
+        await run_in_threadpool(release_images, saved_urls, file_storage, derivative_repo)
+        raise
 
-    # 4. Trigger Heavy Task
-    background_tasks.add_task(
+    # 4. Trigger Heavy Task (operators are waiting: ahead of reference builds)
+    scheduler.submit(
         process_job_3d_generation, 
         db_job.id, 
         front_url, 
-        side_url  
+        side_url,
+        job_deadline(deadline_seconds),
+        reference_part.part_type,
+        priority_class="interactive",
+        part_type="comparison",
+        on_drop=partial(drop_job, db_job.id)
     )
 
     return db_job
 
+@router.post("/multiview", response_model=schemas.ComparisonJob)
+async def create_and_run_multiview_comparison(
+    scheduler: JobScheduler = Depends(get_scheduler),
+    job_creator: IJobCreator = Depends(get_job_repository),
+    part_reader: IPartReader = Depends(get_part_repository),
+    file_storage: IFileStorage = Depends(get_file_storage),
+    derivative_repo: IDerivativeRepository = Depends(get_derivative_repository),
+    reference_part_id: int = Form(...),
+    angles: str = Form(..., description="Turntable angle of each image in degrees, comma-separated"),
+    axis_x: Optional[str] = Form(None, description="Turntable axis column of each image as a fraction of its width"),
+    images: List[UploadFile] = File(...),
+    deadline_seconds: Optional[int] = Form(None, gt=0, description="Seconds the job may take from submission before it times out")
+):
+    """
+    Comparison from N calibrated views (space carving) instead of a front/side pair.
+    """
+    view_angles = parse_floats(angles, "angles")
+    view_axes = parse_floats(axis_x, "axis_x") or [None] * len(images)
+    if not 2 <= len(images) <= MAX_VIEWS:
+        raise HTTPException(status_code=400, detail=f"Between 2 and {MAX_VIEWS} images are required.")
+    if len(view_angles) != len(images) or len(view_axes) != len(images):
+        raise HTTPException(status_code=400, detail="One angle (and axis, if given) is required per image.")
+    if not all(axis is None or 0 <= axis <= 1 for axis in view_axes):
+        raise HTTPException(status_code=400, detail="'axis_x' values must be fractions of the image width, between 0 and 1.")
+    reference_part = part_reader.get_part(reference_part_id)
+    if reference_part is None:
+        raise HTTPException(status_code=404, detail="Reference part not found")
+
+    INPUT_DIR = "uploads/inputs"
+    uploads = []
+    try:
+        for image in images:
+            data = await image.read()
+            _, url = await run_in_threadpool(file_storage.save, data, image.filename, INPUT_DIR, prefix="job")
+            uploads.append((url, data))
+        await run_in_threadpool(ingest_images, uploads, file_storage, derivative_repo)
+
+        # The first two views fill the front/side columns so existing clients can still show the inputs
+        job_schema = schemas.ComparisonJobCreate(
+            part_id=reference_part_id,
+            input_front_image_url=uploads[0][0],
+            input_side_image_url=uploads[1][0]
+        )
+        views = [(url, angle, axis) for (url, _), angle, axis in zip(uploads, view_angles, view_axes)]
+        # Job and views in one transaction: a failure leaves no job without views behind
+        db_job = job_creator.create_job(job=job_schema, views=[
+            schemas.ComparisonJobViewCreate(position=i, angle=angle, axis_x=axis, image_url=url)
+            for i, (url, angle, axis) in enumerate(views)
+        ])
+    except Exception:
+        await run_in_threadpool(release_images, [url for url, _ in uploads], file_storage, derivative_repo)
+        raise
+
+    scheduler.submit(process_job_multiview_generation, db_job.id, views, job_deadline(deadline_seconds),
+                     reference_part.part_type, priority_class="interactive", part_type="comparison",
+                     on_drop=partial(drop_job, db_job.id))
+
+    return db_job
+
 @router.get("/status/{job_id}", response_model=schemas.JobStatusResponse)
 def get_job_status(job_id: int, job_retriever: IJobRetriever = Depends(get_job_repository)):
     job = job_retriever.get_job(job_id=job_id)
@@ -56,7 +157,8 @@ def get_job_status(job_id: int, job_retriever: IJobRetriever = Depends(get_job_r
     
     return {
         "status": job.status.lower(),
-        "modelUrl": job.output_model_url
+        "modelUrl": job.output_model_url,
+        "segmentation": {row.view: row.path for row in job.segmentation},
     }
 
 @router.put("/{job_id}/status", response_model=schemas.ComparisonJob)
@@ -70,3 +172,24 @@ def update_job_status_final(job_id: int, new_status: str = None, job_repo: IJobU
         raise HTTPException(status_code=404, detail="Comparison Job not found")
         
     return updated_job
+
+@router.delete("/{job_id}", response_model=schemas.ComparisonJob)
+def cancel_comparison(job_id: int, job_repo: IJobRepository = Depends(get_job_repository)):
+    """
+    Cancels a pending or processing comparison job. A running pipeline stops at its next
+    checkpoint and deletes its temporary files.
+    """
+    job = job_repo.get_job(job_id=job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Comparison Job not found")
+    if is_active_status(job.status):
+        # Re-checked under a row lock: the worker may finish the job in between
+        job = job_repo.update_job_status(job_id, JobCancelled.status, only_if_active=True)
+        if job is None:
+            # Deleted (with its part) since it was read
+            raise HTTPException(status_code=404, detail="Comparison Job not found")
+        if job.status == JobCancelled.status:
+            # Jobs running in this process stop right away; others notice at their next status poll
+            cancellations.cancel(job_id)
+            return job
+    raise HTTPException(status_code=409, detail=f"Comparison Job already finished with status {job.status}.")
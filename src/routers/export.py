@@ -0,0 +1,66 @@
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from typing import Callable, Iterator, Optional
+from datetime import datetime
+
+from ..domain import models
+from ..core.dependencies import get_session_factory, get_part_exporter_factory, get_job_exporter_factory
+from ..repositories.interfaces import IPartExporter, IJobExporter
+from ..services.export_service import EXPORT_MEDIA_TYPES, serialize_rows
+
+router = APIRouter(
+    prefix="/api/export",
+    tags=["export"]
+)
+
+ExportFormat = Query("ndjson", pattern="^(ndjson|csv)$")
+
+def _stream(session_factory: Callable[[], Session], fetch: Callable[[Session], Iterator[dict]],
+            export_format: str, columns: list) -> Iterator[str]:
+    # The session lives as long as the response body is being sent
+    db = session_factory()
+    try:
+        yield from serialize_rows(fetch(db), export_format, columns)
+    finally:
+        db.close()
+
+def _response(body: Iterator[str], export_format: str, name: str) -> StreamingResponse:
+    return StreamingResponse(
+        body,
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{export_format}"'},
+    )
+
+@router.get("/jobs")
+def export_jobs(format: str = ExportFormat,
+                part_id: Optional[int] = None,
+                status: Optional[str] = None,
+                created_after: Optional[datetime] = None,
+                created_before: Optional[datetime] = None,
+                session_factory: Callable[[], Session] = Depends(get_session_factory),
+                job_exporter: Callable[[Session], IJobExporter] = Depends(get_job_exporter_factory)):
+    """
+    Streams every matching ComparisonJob as NDJSON or CSV, in id order.
+    """
+    columns = [c.name for c in models.ComparisonJob.__table__.columns]
+    fetch = lambda db: job_exporter(db).iter_jobs(
+        part_id=part_id, status=status, created_after=created_after, created_before=created_before
+    )
+    return _response(_stream(session_factory, fetch, format, columns), format, "comparison_jobs")
+
+@router.get("/parts")
+def export_parts(format: str = ExportFormat,
+                 type: Optional[str] = None,
+                 created_after: Optional[datetime] = None,
+                 created_before: Optional[datetime] = None,
+                 session_factory: Callable[[], Session] = Depends(get_session_factory),
+                 part_exporter: Callable[[Session], IPartExporter] = Depends(get_part_exporter_factory)):
+    """
+    Streams the parts catalog as NDJSON or CSV, in id order.
+    """
+    columns = [c.name for c in models.Part.__table__.columns]
+    fetch = lambda db: part_exporter(db).iter_parts(
+        part_type=type, created_after=created_after, created_before=created_before
+    )
+    return _response(_stream(session_factory, fetch, format, columns), format, "parts")
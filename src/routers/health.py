@@ -0,0 +1,22 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from ..core.lifecycle import state
+
+router = APIRouter(
+    prefix="/health",
+    tags=["health"]
+)
+
+@router.get("/live")
+def liveness():
+    """The process is up and serving requests."""
+    return {"status": "alive"}
+
+@router.get("/ready")
+def readiness():
+    """
+    200 once the schema is in place. The body also reports whether the reconstruction
+    models have finished warming up ('warmup': pending / running / done / failed / disabled).
+    """
+    body = state.as_dict()
+    return JSONResponse(status_code=200 if body["ready"] else 503, content=body)
@@ -1,11 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Optional
+from datetime import datetime
+from pydantic import ValidationError
+import zipfile
 
 from ..domain import schemas, models
-from ..repositories.interfaces import IPartRepository, IPartReader, IPartWriter, IJobSearcher
-from ..core.dependencies import get_part_repository, get_job_repository, get_file_storage
+from ..repositories.interfaces import DuplicateSkuError, IPartRepository, IPartReader, IPartWriter, IJobSearcher, IDerivativeRepository
+from ..core.dependencies import get_part_repository, get_job_repository, get_file_storage, get_derivative_repository, get_scheduler
+from ..core.pagination import MAX_PAGE_SIZE, decode_cursor, paginate
 from ..services.storage import IFileStorage
+from ..services.bulk_import import parse_manifest, upload_images
+from ..services.ingest_service import ingest_images, release_images
 from ..workers.tasks import process_part_3d_generation
+from ..workers.scheduler import JobScheduler
+
+# Parts whose images are held in memory at once while a bulk import builds derivatives
+INGEST_BATCH_SIZE = 50
 
 router = APIRouter(
     prefix="/api/parts",
@@ -14,9 +25,10 @@ router = APIRouter(
 
 @router.post("/", response_model=schemas.Part, status_code=201)
 async def create_new_part(
-    background_tasks: BackgroundTasks,
+    scheduler: JobScheduler = Depends(get_scheduler),
     part_repo: IPartRepository = Depends(get_part_repository),
     file_storage: IFileStorage = Depends(get_file_storage),
+    derivative_repo: IDerivativeRepository = Depends(get_derivative_repository),
     name: str = Form(...),
     sku: str = Form(...),
     side_image: UploadFile = File(...),
@@ -26,35 +38,151 @@ async def create_new_part(
     
     db_part = part_repo.get_part_by_sku(sku=sku)
     if db_part:
-        raise HTTPException(status_code=400, detail=f"SKU '{sku}' already registered.")
+        raise HTTPException(status_code=409, detail=f"SKU '{sku}' already registered.")
 
     # Streaming Upload (Optimized for Memory)
     STATIC_IMAGES_DIR = "uploads/images" # Can be 'folder' in Cloudinary
     
-    _, side_url = file_storage.save_stream(side_image.file, side_image.filename, STATIC_IMAGES_DIR)
-    _, front_url = file_storage.save_stream(front_image.file, front_image.filename, STATIC_IMAGES_DIR)
-
-    part_data = schemas.PartCreate(
-        name=name,
-        sku=sku,
-        side_image_url=side_url,
-        front_image_url=front_url,
-        part_type=part_type
-    )
-    new_part = part_repo.create_part(part=part_data)
+    saved_urls = []
+    try:
+        # Saving hashes the file and may wait on the blob index row lock: off the event loop
+        _, side_url = await run_in_threadpool(file_storage.save_stream, side_image.file, side_image.filename, STATIC_IMAGES_DIR)
+        saved_urls.append(side_url)
+        _, front_url = await run_in_threadpool(file_storage.save_stream, front_image.file, front_image.filename, STATIC_IMAGES_DIR)
+        saved_urls.append(front_url)
+
+        # Working copy + preview, built once here instead of in every job that reads the originals;
+        # the spooled uploads are read back off the event loop
+        await run_in_threadpool(
+            ingest_images,
+            [(side_url, side_image.file), (front_url, front_image.file)],
+            file_storage,
+            derivative_repo,
+        )
 
-    background_tasks.add_task(
+        part_data = schemas.PartCreate(
+            name=name,
+            sku=sku,
+            side_image_url=side_url,
+            front_image_url=front_url,
+            part_type=part_type
+        )
+        new_part = part_repo.create_part(part=part_data)
+    except Exception as e:
+        # No part refers to the images saved so far
+        await run_in_threadpool(release_images, saved_urls, file_storage, derivative_repo)
+        if isinstance(e, DuplicateSkuError):
+            raise HTTPException(status_code=409, detail=f"SKU '{sku}' already registered.")
+        raise
+
+    scheduler.submit(
         process_part_3d_generation,
         new_part.id,
         front_url,
-        side_url
+        side_url,
+        new_part.part_type,
+        priority_class="batch",
+        part_type=new_part.part_type
     )
     
     return new_part
 
+@router.post("/bulk", response_model=schemas.BulkImportResponse, status_code=201)
+def create_parts_in_bulk(
+    scheduler: JobScheduler = Depends(get_scheduler),
+    part_repo: IPartRepository = Depends(get_part_repository),
+    file_storage: IFileStorage = Depends(get_file_storage),
+    derivative_repo: IDerivativeRepository = Depends(get_derivative_repository),
+    manifest: UploadFile = File(...),
+    archive: UploadFile = File(...),
+):
+    """
+    Registers many parts at once from a manifest (CSV or JSON) and a ZIP archive with the images
+    referenced by it. SKUs that already exist, repeat in the manifest, or miss an image are skipped.
+    """
+    try:
+        entries = parse_manifest(manifest.file.read(), manifest.filename or "")
+        images = zipfile.ZipFile(archive.file)
+    except (ValueError, zipfile.BadZipFile) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # One set query for the whole manifest instead of one lookup per SKU
+    existing_skus = part_repo.get_existing_skus(entry["sku"] for entry in entries)
+    archive_members = set(images.namelist())
+
+    accepted, skipped, seen = [], [], set()
+    for entry in entries:
+        sku = entry["sku"]
+        if sku in existing_skus:
+            skipped.append(schemas.BulkImportSkipped(sku=sku, reason="SKU already registered."))
+        elif sku in seen:
+            skipped.append(schemas.BulkImportSkipped(sku=sku, reason="SKU repeated in manifest."))
+        elif entry["front_image"] not in archive_members or entry["side_image"] not in archive_members:
+            skipped.append(schemas.BulkImportSkipped(sku=sku, reason="Image not found in archive."))
+        else:
+            seen.add(sku)
+            accepted.append(entry)
+
+    # Validated before anything is uploaded; the image URLs are filled in afterwards
+    try:
+        parts_data = [
+            schemas.PartCreate(
+                name=entry["name"],
+                sku=entry["sku"],
+                side_image_url="",
+                front_image_url="",
+                part_type=entry.get("part_type") or "reference",
+            )
+            for entry in accepted
+        ]
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    STATIC_IMAGES_DIR = "uploads/images"
+    urls = upload_images(accepted, images, file_storage, STATIC_IMAGES_DIR)
+
+    try:
+        for start in range(0, len(accepted), INGEST_BATCH_SIZE):
+            batch = []
+            for entry, (side_url, front_url) in zip(accepted[start:start + INGEST_BATCH_SIZE], urls[start:start + INGEST_BATCH_SIZE]):
+                batch.append((side_url, images.read(entry["side_image"])))
+                batch.append((front_url, images.read(entry["front_image"])))
+            ingest_images(batch, file_storage, derivative_repo)
+
+        parts_data = [
+            part.model_copy(update={"side_image_url": side_url, "front_image_url": front_url})
+            for part, (side_url, front_url) in zip(parts_data, urls)
+        ]
+        new_parts = part_repo.create_parts(parts=parts_data) if parts_data else []
+    except Exception as e:
+        release_images([url for pair in urls for url in pair], file_storage, derivative_repo)
+        if isinstance(e, DuplicateSkuError):
+            raise HTTPException(status_code=409, detail="One or more SKUs were registered by another request; nothing was imported.")
+        raise
+
+    # Queued behind interactive comparisons and bounded by the part type quota, see workers/scheduler.py
+    for part in new_parts:
+        scheduler.submit(
+            process_part_3d_generation, part.id, part.front_image_url, part.side_image_url, part.part_type,
+            priority_class="batch", part_type=part.part_type,
+        )
+
+    return {"created": new_parts, "skipped": skipped}
+
 @router.get("/", response_model=List[schemas.Part])
-def read_all_parts(skip: int = 0, limit: int = 100, type: str = "reference", part_reader: IPartReader = Depends(get_part_repository)):
-    return part_reader.get_parts(skip=skip, limit=limit, part_type=type)
+def read_all_parts(request: Request,
+                   response: Response,
+                   skip: int = 0,
+                   limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+                   type: str = "reference",
+                   cursor: Optional[str] = None,
+                   created_after: Optional[datetime] = None,
+                   created_before: Optional[datetime] = None,
+                   part_reader: IPartReader = Depends(get_part_repository)):
+    # One extra row tells us whether a next page exists (see 'Link' / 'X-Next-Cursor' headers)
+    parts = part_reader.get_parts(skip=skip, limit=limit + 1, part_type=type, cursor=decode_cursor(cursor),
+                                  created_after=created_after, created_before=created_before)
+    return paginate(parts, limit, request, response)
 
 @router.get("/{part_id}", response_model=schemas.Part)
 def read_one_part(part_id: int, part_reader: IPartReader = Depends(get_part_repository)):
@@ -64,19 +192,37 @@ def read_one_part(part_id: int, part_reader: IPartReader = Depends(get_part_repo
     return db_part
 
 @router.delete("/{part_id}", response_model=schemas.Part)
-def delete_existing_part(part_id: int, part_writer: IPartWriter = Depends(get_part_repository)):
+def delete_existing_part(part_id: int,
+                         part_writer: IPartWriter = Depends(get_part_repository),
+                         job_searcher: IJobSearcher = Depends(get_job_repository),
+                         file_storage: IFileStorage = Depends(get_file_storage),
+                         derivative_repo: IDerivativeRepository = Depends(get_derivative_repository)):
+    # Read before the delete cascades to the part's jobs
+    job_input_urls = job_searcher.get_input_urls_by_part(part_id)
     deleted_part = part_writer.delete_part(part_id=part_id)
     if deleted_part is None:
         raise HTTPException(status_code=404, detail="Part not found")
+
+    # Images are shared by content; the blobs (and their derivatives) go away only with their last reference
+    release_images([deleted_part.side_image_url, deleted_part.front_image_url, *job_input_urls],
+                   file_storage, derivative_repo)
     return deleted_part
 
 @router.get("/{part_id}/jobs", response_model=List[schemas.ComparisonJob])
-def read_jobs_by_part(part_id: int, 
+def read_jobs_by_part(part_id: int,
+                      request: Request,
+                      response: Response,
+                      limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+                      cursor: Optional[str] = None,
+                      status: Optional[str] = None,
+                      created_after: Optional[datetime] = None,
+                      created_before: Optional[datetime] = None,
                       part_reader: IPartReader = Depends(get_part_repository),
                       job_searcher: IJobSearcher = Depends(get_job_repository)):
     db_part = part_reader.get_part(part_id=part_id)
     if db_part is None:
         raise HTTPException(status_code=404, detail="Part not found")
     
-    jobs = job_searcher.get_jobs_by_part(part_id=part_id)
-    return jobs
+    jobs = job_searcher.get_jobs_by_part(part_id=part_id, limit=limit + 1, cursor=decode_cursor(cursor), status=status,
+                                         created_after=created_after, created_before=created_before)
+    return paginate(jobs, limit, request, response)
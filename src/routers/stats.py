@@ -1,13 +1,40 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request, Response
+import hashlib
+import json
+import os
 from ..domain import schemas
 from ..repositories.interfaces import IStatsReader
 from ..core.dependencies import get_stats_repository
+from ..core.cache import TTLCache
+from ..core.metrics import metrics
 
 router = APIRouter(
     prefix="/api/stats",
     tags=["stats"]
 )
 
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", "5"))
+
+# Shared by every request in this process: (payload, etag)
+_stats_cache = TTLCache(ttl=STATS_CACHE_TTL)
+
+def _load_stats(stats_reader: IStatsReader) -> tuple:
+    payload = schemas.DashboardStats(**stats_reader.get_dashboard_stats()).model_dump()
+    digest = hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+    return payload, f'"{digest}"'
+
 @router.get("", response_model=schemas.DashboardStats)
-def read_dashboard_stats(stats_reader: IStatsReader = Depends(get_stats_repository)):
-    return stats_reader.get_dashboard_stats()
+def read_dashboard_stats(request: Request, response: Response, stats_reader: IStatsReader = Depends(get_stats_repository)):
+    payload, etag = _stats_cache.get_or_set("dashboard", lambda: _load_stats(stats_reader))
+
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={int(STATS_CACHE_TTL)}"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    return payload
+
+@router.get("/metrics")
+def read_pipeline_metrics():
+    """In-process pipeline metrics (counters, gauges and timings) of the API worker that answers."""
+    return metrics.snapshot()
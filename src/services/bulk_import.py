@@ -0,0 +1,71 @@
+import csv
+import io
+import json
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import List, Tuple
+
+from .storage import IFileStorage
+from ..domain import models
+
+MANIFEST_FIELDS = ("name", "sku", "front_image", "side_image")
+# Manifest values stored as-is in the parts table, checked against their column sizes
+PART_COLUMNS = ("name", "sku", "part_type")
+
+# Parallel uploads per bulk request (I/O bound: disk or Cloudinary round trips)
+BULK_UPLOAD_WORKERS = int(os.getenv("BULK_UPLOAD_WORKERS", "8"))
+
+def parse_manifest(content: bytes, filename: str) -> List[dict]:
+    """
+    Reads a JSON list or a CSV (with header) of parts.
+    Each entry needs name, sku, front_image and side_image (paths inside the archive) as
+    non-empty strings; part_type is optional. Values must fit their parts table columns.
+    """
+    text = content.decode("utf-8-sig")
+    if filename.lower().endswith(".json"):
+        entries = json.loads(text)
+        if not isinstance(entries, list):
+            raise ValueError("O manifesto JSON deve ser uma lista.")
+    else:
+        entries = list(csv.DictReader(io.StringIO(text)))
+
+    for line, entry in enumerate(entries, start=1):
+        if not isinstance(entry, dict):
+            raise ValueError(f"Entrada {line} do manifesto deve ser um objeto.")
+        missing = [field for field in MANIFEST_FIELDS if not isinstance(entry.get(field), str) or not entry[field].strip()]
+        if missing:
+            raise ValueError(f"Entrada {line} do manifesto sem os campos (texto não vazio): {', '.join(missing)}")
+        if entry.get("part_type") is not None and not isinstance(entry["part_type"], str):
+            raise ValueError(f"Entrada {line} do manifesto com part_type inválido.")
+        too_long = [
+            field for field in PART_COLUMNS
+            if entry.get(field) and len(entry[field]) > models.Part.__table__.c[field].type.length
+        ]
+        if too_long:
+            raise ValueError(f"Entrada {line} do manifesto com campos longos demais: {', '.join(too_long)}")
+    return entries
+
+def upload_images(entries: List[dict], archive: zipfile.ZipFile, file_storage: IFileStorage,
+                  directory: str) -> List[Tuple[str, str]]:
+    """
+    Uploads the (side, front) images of every entry concurrently.
+    Returns the (side_url, front_url) pairs in manifest order. If any upload fails, the ones
+    that succeeded are released before the error is raised.
+    """
+    def upload(member: str) -> str:
+        _, url = file_storage.save(archive.read(member), os.path.basename(member), directory)
+        return url
+
+    with ThreadPoolExecutor(max_workers=BULK_UPLOAD_WORKERS) as pool:
+        side_uploads = [pool.submit(upload, entry["side_image"]) for entry in entries]
+        front_uploads = [pool.submit(upload, entry["front_image"]) for entry in entries]
+        wait(side_uploads + front_uploads)
+
+    failed = [upload.exception() for upload in side_uploads + front_uploads if upload.exception()]
+    if failed:
+        for upload in side_uploads + front_uploads:
+            if not upload.exception():
+                file_storage.release(upload.result())
+        raise failed[0]
+    return [(side.result(), front.result()) for side, front in zip(side_uploads, front_uploads)]
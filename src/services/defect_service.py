@@ -1,6 +1,20 @@
 from abc import ABC, abstractmethod
+from typing import Optional
 import cv2
+import hashlib
+import json
 import numpy as np
+import os
+import threading
+from ..core.cache import DiskCache, LRUCache
+from ..core.metrics import metrics
+from .ingest_service import decode_reduced, probe_size, reduction_factor
+
+# Results of frames analyzed before (UI refreshes, retries, several operators) are served from
+# memory, or from DEFECT_CACHE_DIR when set: a directory shared by the API workers of a host
+DEFECT_CACHE_MAX_BYTES = int(os.getenv("DEFECT_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+DEFECT_CACHE_TTL = float(os.getenv("DEFECT_CACHE_TTL", "3600"))
+DEFECT_CACHE_DIR = os.getenv("DEFECT_CACHE_DIR")
 
 class DefectDetectorStrategy(ABC):
     @abstractmethod
@@ -11,10 +25,31 @@ class DefectDetectorStrategy(ABC):
         """
         pass
 
+    def parameters(self) -> dict:
+        """
+        Everything besides the image that shapes the result; part of the result cache key.
+        """
+        return {"detector": type(self).__name__}
+
 class OpenCVContrastDefectDetector(DefectDetectorStrategy):
+    # Bump when the pipeline changes, so cached results of the old one are not served
+    VERSION = 1
+
+    def __init__(self, max_side: int = 0):
+        # When set, frames are decoded with IMREAD_REDUCED_* down to about this size; results
+        # are mapped back to full-frame coordinates. 0 keeps full-resolution analysis.
+        self.max_side = max_side
+
+    def parameters(self) -> dict:
+        return {"detector": type(self).__name__, "version": self.VERSION, "max_side": self.max_side}
+
     def detect(self, image_bytes: bytes) -> dict:
         nparr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        scale = 1
+        if self.max_side:
+            full_h, full_w = probe_size(nparr)
+            scale = reduction_factor(max(full_h, full_w), self.max_side)
+        img = decode_reduced(nparr, scale)
         
         if img is None:
             raise ValueError("Não foi possível decodificar a imagem.")
@@ -30,15 +65,16 @@ class OpenCVContrastDefectDetector(DefectDetectorStrategy):
 
         defects = []
         for cnt in contours:
-            area = cv2.contourArea(cnt)
+            # Areas are compared in full-frame pixels
+            area = cv2.contourArea(cnt) * scale * scale
             # Size Filter
             if 20 < area < 1000: 
                 x, y, w, h = cv2.boundingRect(cnt)
                 defects.append({
-                    "x": x,
-                    "y": y,
-                    "width": w,
-                    "height": h,
+                    "x": x * scale,
+                    "y": y * scale,
+                    "width": w * scale,
+                    "height": h * scale,
                     "type": "anomalia_contraste",
                     "area": area
                 })
@@ -46,15 +82,74 @@ class OpenCVContrastDefectDetector(DefectDetectorStrategy):
         return {
             "total_defects": len(defects),
             "defects": defects,
-            "image_dimensions": {"width": img.shape[1], "height": img.shape[0]}
+            "image_dimensions": {"width": img.shape[1] * scale, "height": img.shape[0] * scale}
         }
 
+class DefectResultCache:
+    """
+    Detection results keyed by the SHA-256 of the image bytes and the detector parameters.
+    Looks in the in-memory LRU first, then in the optional disk tier (promoting hits to memory).
+    Hits, misses and the hit ratio are reported as defect_cache.* metrics.
+    """
+    def __init__(self, memory: LRUCache, disk: Optional[DiskCache] = None):
+        self.memory = memory
+        self.disk = disk
+        self._lookups = {"memory": 0, "disk": 0, "miss": 0}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(image_bytes: bytes, parameters: dict) -> str:
+        digest = hashlib.sha256(image_bytes)
+        digest.update(json.dumps(parameters, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        data, tier = self.memory.get(key), "memory"
+        if data is None and self.disk is not None:
+            data, tier = self.disk.get(key), "disk"
+            if data is not None:
+                self.memory.set(key, data)
+        self._record(tier if data is not None else "miss")
+        # Decoded on every hit, so callers never share (and mutate) a cached object
+        return json.loads(data) if data is not None else None
+
+    def set(self, key: str, result: dict) -> None:
+        data = json.dumps(result).encode()
+        self.memory.set(key, data)
+        if self.disk is not None:
+            self.disk.set(key, data)
+
+    def _record(self, outcome: str) -> None:
+        with self._lock:
+            self._lookups[outcome] += 1
+            total = sum(self._lookups.values())
+            hits = self._lookups["memory"] + self._lookups["disk"]
+        metrics.increment("defect_cache.misses" if outcome == "miss" else f"defect_cache.hits.{outcome}")
+        metrics.set_gauge("defect_cache.hit_ratio", hits / total)
+        metrics.set_gauge("defect_cache.memory_bytes", self.memory.size)
+        metrics.set_gauge("defect_cache.memory_entries", len(self.memory))
+
+defect_result_cache = DefectResultCache(
+    LRUCache(max_bytes=DEFECT_CACHE_MAX_BYTES, ttl=DEFECT_CACHE_TTL),
+    DiskCache(DEFECT_CACHE_DIR, ttl=DEFECT_CACHE_TTL) if DEFECT_CACHE_DIR else None,
+)
+
 class DefectService:
-    def __init__(self, strategy: DefectDetectorStrategy):
+    def __init__(self, strategy: DefectDetectorStrategy, cache: Optional[DefectResultCache] = None):
         self.strategy = strategy
+        self.cache = cache
 
     def analyze(self, image_bytes: bytes) -> dict:
-        return self.strategy.detect(image_bytes)
+        if self.cache is None:
+            return self.strategy.detect(image_bytes)
+
+        # A hit costs one hash of the bytes: the image is not decoded at all
+        key = self.cache.key(image_bytes, self.strategy.parameters())
+        result = self.cache.get(key)
+        if result is None:
+            result = self.strategy.detect(image_bytes)
+            self.cache.set(key, result)
+        return result
 
 def analyze_image_for_defects(image_bytes: bytes) -> dict:
     service = DefectService(OpenCVContrastDefectDetector())
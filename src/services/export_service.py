@@ -0,0 +1,48 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Iterable, Iterator, List
+
+# Rows are buffered and flushed in chunks of this size to keep syscalls (and memory) low
+ROWS_PER_CHUNK = 500
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+def _serialize(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def to_ndjson(rows: Iterable[dict]) -> Iterator[str]:
+    chunk = []
+    for row in rows:
+        chunk.append(json.dumps({k: _serialize(v) for k, v in row.items()}))
+        if len(chunk) >= ROWS_PER_CHUNK:
+            yield "\n".join(chunk) + "\n"
+            chunk = []
+    if chunk:
+        yield "\n".join(chunk) + "\n"
+
+def to_csv(rows: Iterable[dict], columns: List[str]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    pending = 0
+    for row in rows:
+        writer.writerow({k: _serialize(v) for k, v in row.items()})
+        pending += 1
+        if pending >= ROWS_PER_CHUNK:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            pending = 0
+    yield buffer.getvalue()
+
+def serialize_rows(rows: Iterable[dict], export_format: str, columns: List[str]) -> Iterator[str]:
+    if export_format == "csv":
+        return to_csv(rows, columns)
+    return to_ndjson(rows)
@@ -0,0 +1,137 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Dict, Iterable, List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+from ..domain import schemas
+from ..repositories.interfaces import IDerivativeRepository
+from .storage import IFileStorage
+
+# Longest side of each derivative, generated once per uploaded image
+DERIVATIVE_SIZES = {
+    "work": int(os.getenv("WORK_IMAGE_SIZE", "1600")),
+    "preview": int(os.getenv("PREVIEW_IMAGE_SIZE", "320")),
+}
+DERIVATIVES_DIR = "uploads/derived"
+
+# Decoding is CPU bound but OpenCV releases the GIL, so threads scale across cores
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))
+
+# JPEG DCT-domain downscaling: decoding at 1/8 costs a fraction of a full decode
+REDUCED_FLAGS = {
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    1: cv2.IMREAD_COLOR,
+}
+
+def decode_reduced(buffer: np.ndarray, factor: int) -> Optional[np.ndarray]:
+    return cv2.imdecode(buffer, REDUCED_FLAGS[factor])
+
+def reduction_factor(original_side: int, target_side: int) -> int:
+    """Largest IMREAD_REDUCED factor that still yields at least 'target_side' pixels."""
+    for factor in (8, 4, 2):
+        if original_side // factor >= target_side:
+            return factor
+    return 1
+
+def probe_size(buffer: np.ndarray) -> Tuple[int, int]:
+    # A 1/8 grayscale decode is enough to learn the dimensions without decoding the full frame
+    thumb = cv2.imdecode(buffer, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if thumb is None:
+        raise ValueError("Não foi possível decodificar a imagem.")
+    return thumb.shape[0] * 8, thumb.shape[1] * 8
+
+def build_derivatives(image_bytes: bytes, kinds: Iterable[str]) -> Dict[str, Tuple[bytes, int, int]]:
+    """
+    Returns {kind: (jpeg_bytes, width, height)}, decoding the source at the smallest
+    reduction that still covers each requested size. Images already smaller are kept as they are.
+    """
+    buffer = np.frombuffer(image_bytes, np.uint8)
+    height, width = probe_size(buffer)
+    decoded: Dict[int, np.ndarray] = {}
+    derivatives = {}
+
+    for kind in kinds:
+        target = DERIVATIVE_SIZES[kind]
+        factor = reduction_factor(max(height, width), target)
+        if factor not in decoded:
+            img = decode_reduced(buffer, factor)
+            if img is None:
+                raise ValueError("Não foi possível decodificar a imagem.")
+            decoded[factor] = img
+        img = decoded[factor]
+
+        h, w = img.shape[:2]
+        scale = target / max(h, w)
+        if scale < 1:
+            img = cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+
+        ok, encoded = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        if not ok:
+            raise ValueError("Falha ao codificar imagem derivada.")
+        derivatives[kind] = (encoded.tobytes(), img.shape[1], img.shape[0])
+    return derivatives
+
+def ingest_images(images: List[Tuple[str, Union[bytes, BinaryIO]]], file_storage: IFileStorage,
+                  derivative_repo: IDerivativeRepository) -> None:
+    """
+    Generates and stores the working copy and preview of each (original_url, bytes) pair.
+    A file object may stand in for the bytes; it is rewound and read by the worker thread.
+    Originals that already have them (same content uploaded before) are skipped.
+    Failures are logged and leave the original usable: workers fall back to it.
+    """
+    existing = {(d.original_url, d.kind) for d in derivative_repo.get_derivatives(url for url, _ in images)}
+
+    def ingest(item: Tuple[str, Union[bytes, BinaryIO]]) -> List[schemas.ImageDerivative]:
+        original_url, image_bytes = item
+        kinds = [kind for kind in DERIVATIVE_SIZES if (original_url, kind) not in existing]
+        if not kinds:
+            return []
+        if not isinstance(image_bytes, bytes):
+            image_bytes.seek(0)
+            image_bytes = image_bytes.read()
+        try:
+            built = build_derivatives(image_bytes, kinds)
+        except ValueError as e:
+            print(f"Ingest skipped for {original_url}: {e}")
+            return []
+
+        stored = []
+        for kind, (data, width, height) in built.items():
+            _, url = file_storage.save(data, f"{kind}.jpg", DERIVATIVES_DIR, prefix=kind)
+            stored.append(schemas.ImageDerivative(
+                original_url=original_url, kind=kind, url=url, width=width, height=height
+            ))
+        return stored
+
+    pending = list({url: (url, data) for url, data in images}.values())
+    with ThreadPoolExecutor(max_workers=INGEST_WORKERS) as pool:
+        derivatives = [d for batch in pool.map(ingest, pending) for d in batch]
+    # A concurrent ingest of the same content may have registered some first; drop the
+    # references our saves took, or the duplicates would never be collected
+    for derivative in derivative_repo.add_derivatives(derivatives):
+        file_storage.release(derivative.url)
+
+def release_images(urls: Iterable[str], file_storage: IFileStorage, derivative_repo: IDerivativeRepository) -> None:
+    """
+    Drops one stored reference to each original; with its last reference, the working copy and
+    preview built from it are released and forgotten too.
+    """
+    freed = [url for url in urls if file_storage.release(url)]
+    if not freed:
+        return
+    for derivative in derivative_repo.get_derivatives(freed):
+        file_storage.release(derivative.url)
+    derivative_repo.delete_derivatives(freed)
+
+def pick_image_url(original_url: str, derivatives: Iterable, min_side: int) -> str:
+    """
+    Smallest stored derivative whose longest side is at least 'min_side', else the original.
+    """
+    candidates = [d for d in derivatives if d.original_url == original_url and max(d.width, d.height) >= min_side]
+    if not candidates:
+        return original_url
+    return min(candidates, key=lambda d: d.width * d.height).url
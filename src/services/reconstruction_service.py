@@ -1,24 +1,118 @@
 # reconstruction_service.py
 from abc import ABC, abstractmethod
-from typing import Union
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Union
 
 import cv2
 import numpy as np
-import trimesh
-from skimage import measure
-from rembg import remove
 
+import hashlib
 import os
+import struct
 import uuid
 import tempfile
+import threading
+
+from ..core.cancellation import CancellationToken
+from .storage import shard_path
+from .segmentation_service import (
+    SEGMENTATION_MODEL, SEGMENTATION_MODELS_BY_PART_TYPE, SegmentationStrategy,
+    create_segmentation, get_segmentation_session,
+)
+
+# trimesh and scikit-image take seconds to import, so they are loaded on first use
+# (or by warm_up) instead of when the API process imports this module.
+
+def warm_up():
+    """Imports the reconstruction stack and loads every configured segmentation model."""
+    import trimesh  # noqa: F401
+    from skimage import measure  # noqa: F401
+    for model in {SEGMENTATION_MODEL, *SEGMENTATION_MODELS_BY_PART_TYPE.values()}:
+        get_segmentation_session(model)
 
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 OUTPUT_DIR = os.path.join(BASE_DIR, 'uploads', 'models')
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+def load_image(inp: Union[str, bytes]):
+    # Image Loading (path or bytes)
+    if isinstance(inp, (bytes, bytearray)):
+        return cv2.imdecode(np.frombuffer(inp, np.uint8), cv2.IMREAD_COLOR)
+    return cv2.imread(inp, cv2.IMREAD_COLOR)
+
+def save_mesh(voxels: np.ndarray, filename_prefix: str, identifier: int) -> str:
+    """Extracts the surface of an occupancy grid with Marching Cubes and saves it as STL."""
+    from skimage import measure
+
+    # Using level 0.5 for Marching Cubes
+    verts, faces, normals, values = measure.marching_cubes(voxels, level=0.5)
+    return export_mesh(verts, faces, filename_prefix, identifier)
+
+def mesh_path(filename_prefix: str, identifier: int) -> str:
+    # Sharded like uploaded files (see storage.shard_path), on the hash of the name
+    filename = f"{filename_prefix}_{identifier}.stl"
+    directory = shard_path(OUTPUT_DIR, hashlib.sha256(filename.encode()).hexdigest())
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, filename)
+
+def export_mesh(verts: np.ndarray, faces: np.ndarray, filename_prefix: str, identifier: int) -> str:
+    import trimesh
+
+    mesh = trimesh.Trimesh(vertices=verts, faces=faces)
+    
+    file_path = mesh_path(filename_prefix, identifier)
+    
+    mesh.export(file_path)
+    print(f"[{filename_prefix}_{identifier}] Modelo salvo em: {file_path}")
+    
+    return file_path
+
+STL_RECORD = np.dtype([("normal", "<f4", (3,)), ("vertices", "<f4", (3, 3)), ("attributes", "<u2")])
+
+class StlWriter:
+    """
+    Binary STL written piece by piece, so a large mesh never has to be held in memory at once.
+    The triangle count in the header is patched on close.
+    """
+    def __init__(self, file_path: str):
+        self.file = open(file_path, "wb")
+        self.file.write(b"\0" * 80 + struct.pack("<I", 0))
+        self.count = 0
+
+    def write(self, verts: np.ndarray, faces: np.ndarray):
+        triangles = verts[faces].astype(np.float32)
+        normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+        lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+        records = np.zeros(len(faces), dtype=STL_RECORD)
+        records["normal"] = normals / np.where(lengths > 0, lengths, 1)
+        records["vertices"] = triangles
+        self.file.write(records.tobytes())
+        self.count += len(faces)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.file.seek(80)
+        self.file.write(struct.pack("<I", self.count))
+        self.file.close()
+        # An aborted mesh is useless, don't leave it on disk
+        if exc_type is not None:
+            os.remove(self.file.name)
+
 # 1. Abstraction
 class ReconstructionStrategy(ABC):
+    # Longest side the source images should have; 0 leaves it to the worker default
+    min_source_side: int = 0
+    # Set by the worker running a job; checkpoint() raises once the job is cancelled or expires
+    cancellation: Optional[CancellationToken] = None
+
+    def checkpoint(self):
+        if self.cancellation is not None:
+            self.cancellation.check()
+
     @abstractmethod
     def reconstruct(self, front_input: Union[str, bytes], side_input: Union[str, bytes], filename_prefix: str, identifier: int) -> str:
         """
@@ -29,55 +123,38 @@ class ReconstructionStrategy(ABC):
 
 # 2. Concrete Implementation (Silhouette Based)
 class SilhouetteReconstructionStrategy(ReconstructionStrategy):
+    # The dense grid and Marching Cubes grow cubically with it; see AdaptiveSilhouetteReconstructionStrategy
+    max_resolution = 300
+
+    def __init__(self, segmentation_model: Optional[str] = None, segmentation: Optional[SegmentationStrategy] = None):
+        # rembg model name or path to a custom (e.g. INT8-quantized) ONNX file
+        self.segmentation_model = segmentation_model or SEGMENTATION_MODEL
+        # The classical fast path segments at the source size the strategy asked for
+        self.segmentation = segmentation or create_segmentation(self.segmentation_model, self.min_source_side)
+        # Which segmentation path each view took in the last reconstruction, e.g. {"front": "classical"}
+        self.segmentation_report: Dict[str, str] = {}
+
+    def get_mask(self, img):
+        return self.segmentation.segment(img)
+
     def reconstruct(self, front_input: Union[str, bytes], side_input: Union[str, bytes], filename_prefix: str, identifier: int) -> str:
         # 1. Image Loading (path or bytes)
         print(f"Loading images")
-        def load_image(inp):
-            if isinstance(inp, (bytes, bytearray)):
-                img = cv2.imdecode(np.frombuffer(inp, np.uint8), cv2.IMREAD_COLOR)
-            else:
-                img = cv2.imread(inp, cv2.IMREAD_COLOR)
-            return img
-
         img_frontal = load_image(front_input)
         img_lateral = load_image(side_input)
 
         if img_frontal is None or img_lateral is None:
             raise ValueError("Falha ao decodificar imagens enviadas.")
 
-        print(f"[{filename_prefix}_{identifier}] Iniciando segmentação (rembg)...")
-
-        def get_mask(img):
-            # Use rembg to remove background and obtain alpha mask
-            is_success, buffer = cv2.imencode(".png", img)
-            if not is_success:
-                raise ValueError("Falha ao codificar imagem para rembg.")
-
-            input_bytes = buffer.tobytes()
-            try:
-                output_bytes = remove(input_bytes)
-            except Exception as e:
-                raise Exception(f"Erro na rembg: {e}")
-
-            img_array = np.frombuffer(output_bytes, np.uint8)
-            result = cv2.imdecode(img_array, cv2.IMREAD_UNCHANGED)
-            if result is None:
-                raise ValueError("Falha ao decodificar imagem retornada pelo rembg.")
-
-            # Extract alpha channel as mask, or fallback to threshold
-            if result.ndim == 3 and result.shape[2] == 4:
-                mask = result[:, :, 3]
-            elif result.ndim == 2:
-                mask = result
-            else:
-                gray = cv2.cvtColor(result, cv2.COLOR_BGR2GRAY)
-                _, mask = cv2.threshold(gray, 1, 255, cv2.THRESH_BINARY)
-
-            _, binary = cv2.threshold(mask, 127, 255, cv2.THRESH_BINARY)
-            return binary
+        print(f"[{filename_prefix}_{identifier}] Iniciando segmentação...")
 
-        mascara_frontal = get_mask(img_frontal)
-        mascara_lateral = get_mask(img_lateral)
+        self.checkpoint()
+        mascara_frontal = self.get_mask(img_frontal)
+        self.segmentation_report["front"] = self.segmentation.last_path
+        self.checkpoint()
+        mascara_lateral = self.get_mask(img_lateral)
+        self.segmentation_report["side"] = self.segmentation.last_path
+        print(f"[{filename_prefix}_{identifier}] Segmentação: {self.segmentation_report}")
 
         print(f"[{filename_prefix}_{identifier}] Processando geometria...")
 
@@ -95,8 +172,7 @@ class SilhouetteReconstructionStrategy(ReconstructionStrategy):
         ml_recortada = np.pad(ml_recortada, 1, mode='constant', constant_values=0)
 
 
-        MAX_RESOLUTION = 300
-        altura_alvo = min(max(mf_recortada.shape[0], ml_recortada.shape[0]), MAX_RESOLUTION)
+        altura_alvo = min(max(mf_recortada.shape[0], ml_recortada.shape[0]), self.max_resolution)
         
         def redimensionar(mascara, h_alvo):
             h, w = mascara.shape
@@ -108,27 +184,254 @@ class SilhouetteReconstructionStrategy(ReconstructionStrategy):
         mf_final = redimensionar(mf_recortada, altura_alvo)
         ml_final = redimensionar(ml_recortada, altura_alvo)
 
-        mf_norm = (mf_final / 255.0).astype(np.uint8)
-        ml_norm = (ml_final / 255.0).astype(np.uint8)
+        self.checkpoint()
+        return self.build_mesh(mf_final > 0, ml_final > 0, filename_prefix, identifier)
 
-        grid_frontal = mf_norm[:, :, np.newaxis]
-        grid_lateral = ml_norm[:, np.newaxis, :]
+    def build_mesh(self, front: np.ndarray, side: np.ndarray, filename_prefix: str, identifier: int) -> str:
+        """
+        Intersects the extruded silhouettes (boolean, same height) and saves the surface.
+        """
+        grid_frontal = front[:, :, np.newaxis]
+        grid_lateral = side[:, np.newaxis, :]
         
         voxels = (grid_frontal & grid_lateral).astype(np.uint8)
 
-        # Using level 0.5 for Marching Cubes
-        verts, faces, normals, values = measure.marching_cubes(voxels, level=0.5)
-        
-        mesh = trimesh.Trimesh(vertices=verts, faces=faces)
-        
-        filename = f"{filename_prefix}_{identifier}.stl"
-        file_path = os.path.join(OUTPUT_DIR, filename)
-        
-        mesh.export(file_path)
+        return save_mesh(voxels, filename_prefix, identifier)
+
+# Voxels per side reached along the edges by the adaptive hull, and the brick (coarse cell) size
+ADAPTIVE_RESOLUTION = int(os.getenv("ADAPTIVE_RESOLUTION", "1024"))
+ADAPTIVE_BRICK = int(os.getenv("ADAPTIVE_BRICK", "32"))
+
+class AdaptiveSilhouetteReconstructionStrategy(SilhouetteReconstructionStrategy):
+    """
+    Two-view hull at ADAPTIVE_RESOLUTION without a dense grid.
+
+    The volume is split into bricks of ADAPTIVE_BRICK³ voxels. Running sums of both silhouettes
+    tell, per brick, whether it is empty, full or mixed; only mixed bricks hold surface, so only
+    those are sampled at full resolution and meshed. Each brick also samples the first voxel
+    layer of its neighbours, so the pieces meet without gaps. Time follows the surface area (R²)
+    instead of the volume (R³), and memory stays flat since triangles are streamed to the STL.
+    See benchmarks/bench_adaptive_hull.py for the resolution / time / RSS curve.
+    """
+    def __init__(self, segmentation_model: Optional[str] = None, segmentation: Optional[SegmentationStrategy] = None,
+                 resolution: int = ADAPTIVE_RESOLUTION, brick: int = ADAPTIVE_BRICK):
+        # The silhouettes are cropped to the part, so ask for sources with headroom around it
+        # (set first: the segmentation keeps that resolution instead of a 512 px mask)
+        self.min_source_side = 2 * resolution
+        super().__init__(segmentation_model, segmentation)
+        self.max_resolution = resolution
+        self.brick = brick
+
+    def build_mesh(self, front: np.ndarray, side: np.ndarray, filename_prefix: str, identifier: int) -> str:
+        from skimage import measure
+
+        bricks = self.surface_bricks(front, side)
+        if not bricks:
+            raise ValueError("Silhuetas vazias, nenhuma superfície para extrair.")
+        print(f"[{filename_prefix}_{identifier}] Refinando {len(bricks)} blocos de {self.brick}³...")
+
+        # STL stores each triangle on its own, so the pieces are streamed as they are extracted
+        file_path = mesh_path(filename_prefix, identifier)
+        with StlWriter(file_path) as stl:
+            for y0, x0, z0 in bricks:
+                self.checkpoint()
+                y1, x1, z1 = y0 + self.brick + 1, x0 + self.brick + 1, z0 + self.brick + 1
+                block = (front[y0:y1, x0:x1, np.newaxis] & side[y0:y1, np.newaxis, z0:z1]).astype(np.uint8)
+                verts, faces, _, _ = measure.marching_cubes(block, level=0.5)
+                stl.write(verts + (y0, x0, z0), faces)
+
         print(f"[{filename_prefix}_{identifier}] Modelo salvo em: {file_path}")
-        
         return file_path
 
+    def surface_bricks(self, front: np.ndarray, side: np.ndarray) -> List[tuple]:
+        """
+        Origins (y, x, z) of the bricks whose samples, including the shared layer with the next
+        brick on each axis, are neither all empty nor all full.
+        """
+        b = self.brick
+        height = front.shape[0]
+        starts = [np.arange(0, n - 1, b) for n in (height, front.shape[1], side.shape[1])]
+
+        def ranges(axis_starts: np.ndarray, n: int):
+            return axis_starts, np.minimum(axis_starts + b + 1, n)
+
+        def column_counts(mask: np.ndarray, axis_starts: np.ndarray) -> np.ndarray:
+            # (rows, bricks): foreground pixels of each row inside each brick's column range
+            lo, hi = ranges(axis_starts, mask.shape[1])
+            cumulative = np.pad(np.cumsum(mask, axis=1, dtype=np.int32), ((0, 0), (1, 0)))
+            return cumulative[:, hi] - cumulative[:, lo]
+
+        front_counts = column_counts(front, starts[1])
+        side_counts = column_counts(side, starts[2])
+        front_widths = np.diff(np.stack(ranges(starts[1], front.shape[1])), axis=0)[0]
+        side_widths = np.diff(np.stack(ranges(starts[2], side.shape[1])), axis=0)[0]
+
+        y_lo, y_hi = ranges(starts[0], height)
+        mixed = []
+        for yi, (lo, hi) in enumerate(zip(y_lo, y_hi)):
+            f_rows, s_rows = front_counts[lo:hi], side_counts[lo:hi]
+            # Occupied iff some row has foreground in both views; full iff every row is full in both
+            occupied = (f_rows > 0).T.astype(np.float32) @ (s_rows > 0).astype(np.float32) > 0
+            full = (f_rows == front_widths).all(axis=0)[:, np.newaxis] & (s_rows == side_widths).all(axis=0)[np.newaxis, :]
+            for xi, zi in zip(*np.nonzero(occupied & ~full)):
+                mixed.append((int(starts[0][yi]), int(starts[1][xi]), int(starts[2][zi])))
+        return mixed
+
+@dataclass
+class CalibratedView:
+    """
+    One silhouette of a turntable capture: the camera looks at the part horizontally from
+    'angle' degrees around the vertical axis (0 = front, 90 = side). Projection is orthographic
+    and every view shares the same scale; 'axis_x' is the column of the turntable axis as a
+    fraction of the image width (defaults to 0.5), so it holds for any derivative resolution.
+    """
+    image: Union[str, bytes]
+    angle: float
+    axis_x: Optional[float] = None
+
+class MultiViewReconstructionStrategy(ReconstructionStrategy):
+    @abstractmethod
+    def reconstruct_views(self, views: List[CalibratedView], filename_prefix: str, identifier: int) -> str:
+        """
+        Generates a 3D model from any number of calibrated views.
+        Returns the path to the saved model file.
+        """
+        pass
+
+# Voxels per side of the carving grid and the per-block budget that bounds memory
+CARVING_RESOLUTION = int(os.getenv("CARVING_RESOLUTION", "256"))
+CARVING_BLOCK_VOXELS = int(os.getenv("CARVING_BLOCK_VOXELS", str(4_000_000)))
+CARVING_WORKERS = int(os.getenv("CARVING_WORKERS", "4"))
+
+class SpaceCarvingReconstructionStrategy(MultiViewReconstructionStrategy):
+    """
+    Visual hull by space carving: a voxel survives only if it projects inside every silhouette.
+
+    With a turntable (rotation about the vertical axis) a voxel's image row depends only on its
+    height, so the column each (x, z) cell projects to is computed once per view with one matrix
+    product and reused for every horizontal slice. Slices are carved in blocks sized by
+    CARVING_BLOCK_VOXELS, and the views of a block are evaluated in parallel.
+    """
+    def __init__(self, segmentation_model: Optional[str] = None, segmentation: Optional[SegmentationStrategy] = None,
+                 resolution: int = CARVING_RESOLUTION):
+        self.segmentation = segmentation or create_segmentation(segmentation_model)
+        self.resolution = resolution
+        self.segmentation_report: Dict[str, str] = {}
+
+    def reconstruct(self, front_input: Union[str, bytes], side_input: Union[str, bytes], filename_prefix: str, identifier: int) -> str:
+        views = [CalibratedView(front_input, 0.0), CalibratedView(side_input, 90.0)]
+        return self.reconstruct_views(views, filename_prefix, identifier, center_on_silhouette=True)
+
+    def reconstruct_views(self, views: List[CalibratedView], filename_prefix: str, identifier: int,
+                          center_on_silhouette: bool = False) -> str:
+        if len(views) < 2:
+            raise ValueError("São necessárias ao menos duas vistas.")
+
+        print(f"[{filename_prefix}_{identifier}] Segmentando {len(views)} vistas...")
+        masks, axes, paths = self._load_masks(views, center_on_silhouette)
+        self.segmentation_report = {f"{view.angle:g}": path for view, path in zip(views, paths)}
+
+        print(f"[{filename_prefix}_{identifier}] Esculpindo volume ({self.resolution}³)...")
+        voxels = self.carve(masks, axes, [view.angle for view in views])
+        if not voxels.any():
+            raise ValueError("As silhuetas não são consistentes entre as vistas (volume vazio).")
+
+        self.checkpoint()
+        return save_mesh(np.pad(voxels, 1).astype(np.uint8), filename_prefix, identifier)
+
+    def _load_masks(self, views: List[CalibratedView], center_on_silhouette: bool):
+        masks, axes, paths = [], [], []
+        height = None
+        for view in views:
+            self.checkpoint()
+            img = load_image(view.image)
+            if img is None:
+                raise ValueError("Falha ao decodificar imagens enviadas.")
+            mask = self.segmentation.segment(img) > 0
+            paths.append(self.segmentation.last_path)
+
+            # All views must share the same scale: bring them to the height of the first one
+            if height is None:
+                height = mask.shape[0]
+            elif mask.shape[0] != height:
+                new_size = (max(1, int(mask.shape[1] * height / mask.shape[0])), height)
+                mask = cv2.resize(mask.astype(np.uint8), new_size, interpolation=cv2.INTER_NEAREST) > 0
+
+            if center_on_silhouette:
+                cols = np.flatnonzero(mask.any(axis=0))
+                axis = (cols[0] + cols[-1]) / 2 if cols.size else mask.shape[1] / 2
+            else:
+                axis = (0.5 if view.axis_x is None else view.axis_x) * mask.shape[1]
+            masks.append(mask)
+            axes.append(axis)
+        return masks, axes, paths
+
+    def carve(self, masks: List[np.ndarray], axes: List[float], angles: List[float]) -> np.ndarray:
+        """
+        Returns a boolean occupancy grid indexed [y, x, z].
+        """
+        # Bounds in pixel units: rows covered by any silhouette, horizontal radius around the axis
+        rows = np.flatnonzero(np.logical_or.reduce([m.any(axis=1) for m in masks]))
+        if rows.size == 0:
+            return np.zeros((1, 1, 1), dtype=bool)
+        top, bottom = rows[0], rows[-1] + 1
+        radius = max(
+            np.abs(np.flatnonzero(m.any(axis=0)) + 0.5 - axis).max(initial=0.0)
+            for m, axis in zip(masks, axes)
+        )
+        voxel = max(2 * radius, bottom - top) / self.resolution
+        ny = max(1, int(np.ceil((bottom - top) / voxel)))
+        nxz = max(1, int(np.ceil(2 * radius / voxel)))
+
+        # Project every (x, z) cell centre into every view at once: u = axis + x cos(a) + z sin(a)
+        centres = -radius + (np.arange(nxz) + 0.5) * voxel
+        xs, zs = np.meshgrid(centres, centres, indexing="ij")
+        cells = np.stack([xs.ravel(), zs.ravel()], axis=1)                      # (nxz², 2)
+        radians = np.deg2rad(np.asarray(angles, dtype=np.float64))
+        directions = np.stack([np.cos(radians), np.sin(radians)])              # (2, views)
+        columns = np.floor(cells @ directions + np.asarray(axes)).astype(np.int64)  # (nxz², views)
+
+        image_rows = np.minimum(top + ((np.arange(ny) + 0.5) * voxel).astype(np.int64), bottom - 1)
+
+        def view_lookup(index: int):
+            mask = masks[index]
+            cols = columns[:, index]
+            inside = (cols >= 0) & (cols < mask.shape[1])
+            return mask, np.clip(cols, 0, mask.shape[1] - 1), inside
+
+        lookups = [view_lookup(i) for i in range(len(masks))]
+        occupancy = np.empty((ny, nxz * nxz), dtype=bool)
+        block = max(1, CARVING_BLOCK_VOXELS // (nxz * nxz))
+
+        lock = threading.Lock()
+
+        def carve_view(lookup, block_rows: np.ndarray, target: np.ndarray) -> None:
+            mask, cols, inside = lookup
+            # (block, nxz²) gather: the silhouette row of each slice, sampled at each cell's column
+            carved = mask[block_rows][:, cols] & inside
+            # Folded in as each view finishes, so only one gather per worker is alive at a time
+            with lock:
+                target &= carved
+
+        with ThreadPoolExecutor(max_workers=min(CARVING_WORKERS, len(masks))) as pool:
+            for start in range(0, ny, block):
+                self.checkpoint()
+                block_rows = image_rows[start:start + block]
+                target = occupancy[start:start + block]
+                target.fill(True)
+                for _ in pool.map(lambda lookup: carve_view(lookup, block_rows, target), lookups):
+                    pass
+
+        return occupancy.reshape(ny, nxz, nxz)
+
+# Two-view reconstruction used by the workers: "silhouette" (dense grid) or "adaptive"
+RECONSTRUCTION_MODE = os.getenv("RECONSTRUCTION_MODE", "silhouette")
+
+def create_reconstruction_strategy(segmentation_model: Optional[str] = None) -> ReconstructionStrategy:
+    if RECONSTRUCTION_MODE == "adaptive":
+        return AdaptiveSilhouetteReconstructionStrategy(segmentation_model)
+    return SilhouetteReconstructionStrategy(segmentation_model)
+
 # 3. Manager/Facade -> Service with DI
 class ReconstructionService:
     def __init__(self, strategy: ReconstructionStrategy):
@@ -137,6 +440,11 @@ class ReconstructionService:
     def process(self, front_input: str, side_input: str, filename_prefix: str, identifier: int) -> str:
         return self.strategy.reconstruct(front_input, side_input, filename_prefix, identifier)
 
+    def process_views(self, views: List[CalibratedView], filename_prefix: str, identifier: int) -> str:
+        if not isinstance(self.strategy, MultiViewReconstructionStrategy):
+            raise ValueError("A estratégia configurada não suporta múltiplas vistas.")
+        return self.strategy.reconstruct_views(views, filename_prefix, identifier)
+
 def process_images_to_3d(front_image_bytes: bytes, side_image_bytes: bytes, filename_prefix: str, identifier: int) -> str:
     # Uses the default strategy. This can be extended to select strategy via factory.
     strategy = SilhouetteReconstructionStrategy()
@@ -0,0 +1,230 @@
+# segmentation_service.py
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+import os
+import threading
+import time
+from functools import lru_cache
+
+from ..core.metrics import metrics
+
+# rembg (onnxruntime) takes seconds to import, so it is loaded on first use (or by warm-up)
+# instead of when the API process imports this module.
+
+def parse_models_by_part_type(spec: str) -> Dict[str, str]:
+    # "reference:u2net,sample:/models/u2net_int8.onnx" -> {"reference": "u2net", "sample": "/models/..."}
+    models = {}
+    for item in filter(None, (chunk.strip() for chunk in spec.split(","))):
+        part_type, _, model = item.partition(":")
+        models[part_type.strip()] = model.strip()
+    return models
+
+# Segmentation model per deployment: a rembg model name (u2net, u2netp, silueta, ...) or the
+# path of a custom ONNX file such as an INT8-quantized U2Net. It can be overridden per part type
+# (comparison jobs use the type of their reference part). Check accuracy first with benchmarks/segmentation_accuracy.py.
+SEGMENTATION_MODEL = os.getenv("SEGMENTATION_MODEL", "u2net")
+SEGMENTATION_MODELS_BY_PART_TYPE = parse_models_by_part_type(os.getenv("SEGMENTATION_MODELS_BY_PART_TYPE", ""))
+
+# Classical fast path for captures on a uniform backdrop; rembg is only used when its mask scores low.
+# Off until benchmarks/segmentation_accuracy.py --candidate fast-path has gated it on the rig's captures
+SEGMENTATION_FAST_PATH = os.getenv("SEGMENTATION_FAST_PATH", "0") == "1"
+FAST_PATH_MIN_SCORE = float(os.getenv("FAST_PATH_MIN_SCORE", "0.85"))
+# Optional photo of the empty rig backdrop, used for background subtraction instead of colour keying
+BACKGROUND_IMAGE_PATH = os.getenv("BACKGROUND_IMAGE_PATH")
+
+_segmentation_sessions = {}
+_segmentation_lock = threading.Lock()
+
+def segmentation_model_for(part_type: Optional[str]) -> str:
+    return SEGMENTATION_MODELS_BY_PART_TYPE.get(part_type or "", SEGMENTATION_MODEL)
+
+def get_segmentation_session(model: str = SEGMENTATION_MODEL):
+    """
+    Returns a cached rembg session; creating one loads the ONNX model from disk.
+    """
+    with _segmentation_lock:
+        session = _segmentation_sessions.get(model)
+        if session is None:
+            from rembg import new_session
+            if model.endswith(".onnx"):
+                session = new_session("u2net_custom", model_path=model)
+            else:
+                session = new_session(model)
+            _segmentation_sessions[model] = session
+        return session
+
+@lru_cache(maxsize=4)
+def load_background(path: str) -> Optional[np.ndarray]:
+    return cv2.imread(path, cv2.IMREAD_COLOR)
+
+# 1. Abstraction
+class SegmentationStrategy(ABC):
+    # Which path produced the last mask ('rembg', 'classical', ...), for reporting
+    last_path: str = ""
+
+    @abstractmethod
+    def segment(self, img: np.ndarray) -> np.ndarray:
+        """
+        Returns a binary (0/255) uint8 mask of the part, same size as the BGR input image.
+        """
+        pass
+
+# 2. Concrete Implementations
+class RembgSegmentation(SegmentationStrategy):
+    def __init__(self, model: Optional[str] = None):
+        self.model = model or SEGMENTATION_MODEL
+
+    def segment(self, img: np.ndarray) -> np.ndarray:
+        # Use rembg to remove background and obtain alpha mask
+        is_success, buffer = cv2.imencode(".png", img)
+        if not is_success:
+            raise ValueError("Falha ao codificar imagem para rembg.")
+
+        input_bytes = buffer.tobytes()
+        try:
+            from rembg import remove
+            output_bytes = remove(input_bytes, session=get_segmentation_session(self.model))
+        except Exception as e:
+            raise Exception(f"Erro na rembg: {e}")
+
+        img_array = np.frombuffer(output_bytes, np.uint8)
+        result = cv2.imdecode(img_array, cv2.IMREAD_UNCHANGED)
+        if result is None:
+            raise ValueError("Falha ao decodificar imagem retornada pelo rembg.")
+
+        # Extract alpha channel as mask, or fallback to threshold
+        if result.ndim == 3 and result.shape[2] == 4:
+            mask = result[:, :, 3]
+        elif result.ndim == 2:
+            mask = result
+        else:
+            gray = cv2.cvtColor(result, cv2.COLOR_BGR2GRAY)
+            _, mask = cv2.threshold(gray, 1, 255, cv2.THRESH_BINARY)
+
+        _, binary = cv2.threshold(mask, 127, 255, cv2.THRESH_BINARY)
+        self.last_path = "rembg"
+        return binary
+
+class ClassicalSegmentation(SegmentationStrategy):
+    """
+    Background subtraction (against a backdrop photo) or colour keying (backdrop colour estimated
+    from the image border), Otsu threshold and morphology. Runs on a copy downscaled to
+    'working_size' (a few ms at the default); the mask is upscaled with nearest neighbour, so
+    callers that need sharper outlines ask for a larger working size.
+    """
+    WORKING_SIZE = 512
+
+    def __init__(self, background_path: Optional[str] = BACKGROUND_IMAGE_PATH, working_size: int = WORKING_SIZE):
+        self.background = load_background(background_path) if background_path else None
+        self.working_size = working_size
+        # Quality of the last mask in [0, 1], see score()
+        self.last_score = 0.0
+
+    def segment(self, img: np.ndarray) -> np.ndarray:
+        h, w = img.shape[:2]
+        scale = min(1.0, self.working_size / max(h, w))
+        # INTER_LINEAR is ~40x cheaper than INTER_AREA on 12 MP frames and good enough for a mask
+        small = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_LINEAR) if scale < 1 else img
+
+        distance = self._distance_to_background(small)
+        _, mask = cv2.threshold(distance, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=2)
+
+        self.last_score, mask = self.score(distance, mask)
+        self.last_path = "classical"
+
+        if scale < 1:
+            mask = cv2.resize(mask, (w, h), interpolation=cv2.INTER_NEAREST)
+        return mask
+
+    def _distance_to_background(self, img: np.ndarray) -> np.ndarray:
+        lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB).astype(np.float32)
+        if self.background is not None:
+            background = cv2.resize(self.background, (img.shape[1], img.shape[0]), interpolation=cv2.INTER_LINEAR)
+            reference = cv2.cvtColor(background, cv2.COLOR_BGR2LAB).astype(np.float32)
+        else:
+            border = np.concatenate([lab[0], lab[-1], lab[:, 0], lab[:, -1]])
+            reference = np.median(border, axis=0)
+        distance = np.linalg.norm(lab - reference, axis=-1)
+        return cv2.normalize(distance, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+
+    def score(self, distance: np.ndarray, mask: np.ndarray) -> Tuple[float, np.ndarray]:
+        """
+        Scores a mask on three cues and returns (score, mask with only the dominant component):
+        - dominance: share of the foreground taken by the largest component (one object, no clutter)
+        - solidity: component area over convex hull area (ragged masks score low)
+        - edge alignment: share of the component's outline (holes included) lying on edges of the
+          background-distance image (colour edges, so parts with the same brightness as the backdrop still count)
+        The component keeps its holes, so through-holes of washers or brackets stay open.
+        Masks covering almost nothing, almost everything, or touching the frame border score 0.
+        """
+        # Two-level hierarchy: outer outlines at the top, the holes of each one as its children
+        contours, hierarchy = cv2.findContours(mask, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_NONE)
+        if not contours:
+            return 0.0, mask
+
+        outer = [i for i in range(len(contours)) if hierarchy[0][i][3] < 0]
+        largest = max(outer, key=lambda i: cv2.contourArea(contours[i]))
+        holes = [i for i in range(len(contours)) if hierarchy[0][i][3] == largest]
+
+        component = np.zeros_like(mask)
+        cv2.drawContours(component, contours, largest, 255, thickness=cv2.FILLED)
+        for hole in holes:
+            cv2.drawContours(component, contours, hole, 0, thickness=cv2.FILLED)
+        component &= mask
+
+        area = cv2.countNonZero(component)
+        h, w = mask.shape[:2]
+        x, y, cw, ch = cv2.boundingRect(contours[largest])
+        if not 0.005 < area / (h * w) < 0.9 or x == 0 or y == 0 or x + cw >= w or y + ch >= h:
+            return 0.0, mask
+
+        dominance = area / cv2.countNonZero(mask)
+        hull_area = cv2.contourArea(cv2.convexHull(contours[largest]))
+        solidity = min(1.0, area / hull_area) if hull_area > 0 else 0.0
+
+        edges = cv2.Canny(distance, 50, 150)
+        edges = cv2.dilate(edges, np.ones((3, 3), np.uint8))
+        points = np.concatenate([contours[i][:, 0, :] for i in [largest] + holes])
+        edge_alignment = float(np.count_nonzero(edges[points[:, 1], points[:, 0]])) / len(points)
+
+        return 0.4 * dominance + 0.2 * solidity + 0.4 * edge_alignment, component
+
+class FastPathSegmentation(SegmentationStrategy):
+    """
+    Tries the classical mask first and falls back to the neural model when its score is low.
+    """
+    def __init__(self, fallback: SegmentationStrategy, classical: Optional[ClassicalSegmentation] = None,
+                 min_score: float = FAST_PATH_MIN_SCORE):
+        self.classical = classical or ClassicalSegmentation()
+        self.fallback = fallback
+        self.min_score = min_score
+        self.last_score = 0.0
+
+    def segment(self, img: np.ndarray) -> np.ndarray:
+        started = time.perf_counter()
+        mask = self.classical.segment(img)
+        self.last_score = self.classical.last_score
+        if self.last_score >= self.min_score:
+            self.last_path = "classical"
+        else:
+            mask = self.fallback.segment(img)
+            self.last_path = f"{self.fallback.last_path}_fallback"
+
+        metrics.increment(f"segmentation.path.{self.last_path}")
+        metrics.observe(f"segmentation.seconds.{self.last_path}", time.perf_counter() - started)
+        return mask
+
+def create_segmentation(model: Optional[str] = None, working_size: int = 0) -> SegmentationStrategy:
+    """'working_size' is the longest side the classical path segments at (0 keeps its default)."""
+    rembg = RembgSegmentation(model)
+    if not SEGMENTATION_FAST_PATH:
+        return rembg
+    return FastPathSegmentation(rembg, ClassicalSegmentation(working_size=working_size or ClassicalSegmentation.WORKING_SIZE))
@@ -1,10 +1,34 @@
 import os
-import uuid
-from typing import Protocol, Tuple, runtime_checkable, BinaryIO
-import shutil
+import hashlib
+import tempfile
+from typing import Callable, Optional, Protocol, Tuple, runtime_checkable, BinaryIO
 import cloudinary
 import cloudinary.uploader
 
+CHUNK_SIZE = 1024 * 1024
+
+@runtime_checkable
+class IBlobIndex(Protocol):
+    """
+    Reference counts shared by every storage backend, keyed by the content-derived storage key.
+    """
+    def lookup(self, key: str) -> Optional[str]:
+        ...
+
+    def acquire(self, key: str, store: Callable[[Optional[str]], str]) -> str:
+        """
+        Adds one reference to 'key'. 'store(known_url)' makes sure the content exists and returns
+        its URL; it runs while the blob's row is locked, so a concurrent release cannot delete the
+        content between the check and the new reference.
+        """
+        ...
+
+    def release(self, url: str, remove: Optional[Callable[[str], None]] = None) -> Optional[str]:
+        """
+        Drops one reference; with the last one, 'remove(key)' runs under the same row lock.
+        """
+        ...
+
 @runtime_checkable
 class IFileStorage(Protocol):
     def save(self, file_bytes: bytes, original_filename: str, directory: str, prefix: str = "") -> Tuple[str, str]:
@@ -12,85 +36,166 @@ class IFileStorage(Protocol):
         Saves a file and returns (physical_path_or_id, access_url)
         """
         ...
-        
+
     def save_stream(self, file_stream: BinaryIO, original_filename: str, directory: str, prefix: str = "") -> Tuple[str, str]:
         """
         Saves a file from a stream and returns (physical_path_or_id, access_url)
         """
         ...
 
+    def release(self, url: str) -> bool:
+        """
+        Drops one reference to a saved file; the content is deleted with the last reference.
+        Returns True if the content was deleted.
+        """
+        ...
+
+def _extension(original_filename: str) -> str:
+    filename_parts = original_filename.split('.')
+    return filename_parts[-1] if len(filename_parts) > 1 else "bin"
+
+def _content_name(digest: str, prefix: str = "") -> str:
+    return f"{prefix}_{digest}" if prefix else digest
+
+def _touch(file_path: str):
+    # Reused content counts as new for the garbage collector's grace period (see storage_gc.py)
+    try:
+        os.utime(file_path)
+    except FileNotFoundError:
+        pass
+
+def _remove(file_path: str):
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+
+def shard_path(directory: str, digest: str) -> str:
+    """
+    Two levels of hash-prefix subdirectories (65536 leaves), so no directory grows past a few
+    hundred entries: uploads/images/ab/cd/<digest>.jpg
+    """
+    return os.path.join(directory, digest[:2], digest[2:4])
+
 class LocalFileStorage:
-    def __init__(self, base_url: str = "http://localhost:8000"):
+    """
+    Content-addressed storage on local disk: files are named after the SHA-256 of their
+    content, so uploading the same bytes twice writes them once. Files live in hash-prefix
+    shards (see shard_path); files saved before sharding stay where their URLs point.
+    """
+    def __init__(self, base_url: str = "http://localhost:8000", blob_index: Optional[IBlobIndex] = None):
         self.base_url = base_url
+        self.blob_index = blob_index
 
     def save(self, file_bytes: bytes, original_filename: str, directory: str, prefix: str = "") -> Tuple[str, str]:
-        os.makedirs(directory, exist_ok=True)
-        filename_parts = original_filename.split('.')
-        file_extension = filename_parts[-1] if len(filename_parts) > 1 else "bin"
-        
-        if prefix:
-            unique_filename = f"{prefix}_{uuid.uuid4()}.{file_extension}"
-        else:
-            unique_filename = f"{uuid.uuid4()}.{file_extension}"
-            
-        file_path = os.path.join(directory, unique_filename)
-        with open(file_path, "wb") as f:
-            f.write(file_bytes)
-            
-        path_for_url = os.path.join(directory, unique_filename).replace(os.sep, "/")
-        return file_path, f"{self.base_url}/{path_for_url}"
-        
+        digest = hashlib.sha256(file_bytes).hexdigest()
+        file_path = self._path_for(digest, original_filename, directory, prefix)
+
+        def store():
+            if os.path.exists(file_path):
+                _touch(file_path)
+            else:
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                with tempfile.NamedTemporaryFile(dir=os.path.dirname(file_path), delete=False) as tmp:
+                    tmp.write(file_bytes)
+                os.replace(tmp.name, file_path)
+
+        return self._register(file_path, store)
+
     def save_stream(self, file_stream: BinaryIO, original_filename: str, directory: str, prefix: str = "") -> Tuple[str, str]:
         os.makedirs(directory, exist_ok=True)
-        filename_parts = original_filename.split('.')
-        file_extension = filename_parts[-1] if len(filename_parts) > 1 else "bin"
-        
-        if prefix:
-            unique_filename = f"{prefix}_{uuid.uuid4()}.{file_extension}"
+
+        # Hash while copying to a temp file, then move it under its digest (or drop it if already stored)
+        hasher = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=directory, delete=False) as tmp:
+            for chunk in iter(lambda: file_stream.read(CHUNK_SIZE), b""):
+                hasher.update(chunk)
+                tmp.write(chunk)
+
+        file_path = self._path_for(hasher.hexdigest(), original_filename, directory, prefix)
+
+        def store():
+            if os.path.exists(file_path):
+                _touch(file_path)
+            else:
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                os.replace(tmp.name, file_path)
+
+        try:
+            return self._register(file_path, store)
+        finally:
+            # Already stored content (or a failed registration) leaves the temp copy behind
+            if os.path.exists(tmp.name):
+                os.remove(tmp.name)
+
+    def release(self, url: str) -> bool:
+        if self.blob_index is None:
+            return False
+        return self.blob_index.release(url, _remove) is not None
+
+    def url_for(self, file_path: str) -> str:
+        path_for_url = file_path.replace(os.sep, "/")
+        return f"{self.base_url}/{path_for_url}"
+
+    def _path_for(self, digest: str, original_filename: str, directory: str, prefix: str) -> str:
+        return os.path.join(shard_path(directory, digest), f"{_content_name(digest, prefix)}.{_extension(original_filename)}")
+
+    def _register(self, file_path: str, store: Callable[[], None]) -> Tuple[str, str]:
+        url = self.url_for(file_path)
+
+        def store_file(known_url: Optional[str]) -> str:
+            store()
+            return url
+
+        if self.blob_index is not None:
+            self.blob_index.acquire(file_path, store_file)
         else:
-            unique_filename = f"{uuid.uuid4()}.{file_extension}"
-            
-        file_path = os.path.join(directory, unique_filename)
-        with open(file_path, "wb") as f:
-            shutil.copyfileobj(file_stream, f)
-            
-        path_for_url = os.path.join(directory, unique_filename).replace(os.sep, "/")
-        return file_path, f"{self.base_url}/{path_for_url}"
+            store()
+        return file_path, url
 
 class CloudinaryFileStorage:
-    def __init__(self):
+    """
+    Content-addressed Cloudinary storage: the public_id is the SHA-256 of the content and the
+    blob index maps it to its URL, so known content is never uploaded again.
+    """
+    def __init__(self, blob_index: Optional[IBlobIndex] = None):
         # Configuration is handled via CLOUDINARY_URL env var or parameters
-        pass
+        self.blob_index = blob_index
 
     def save(self, file_bytes: bytes, original_filename: str, directory: str, prefix: str = "") -> Tuple[str, str]:
+        digest = hashlib.sha256(file_bytes).hexdigest()
+        return self._upload(file_bytes, digest, directory, prefix)
+
+    def save_stream(self, file_stream: BinaryIO, original_filename: str, directory: str, prefix: str = "") -> Tuple[str, str]:
+        # The digest must be known before deciding to upload, so spool the stream while hashing it
+        hasher = hashlib.sha256()
+        with tempfile.SpooledTemporaryFile(max_size=8 * CHUNK_SIZE) as spool:
+            for chunk in iter(lambda: file_stream.read(CHUNK_SIZE), b""):
+                hasher.update(chunk)
+                spool.write(chunk)
+            spool.seek(0)
+            return self._upload(spool, hasher.hexdigest(), directory, prefix)
+
+    def release(self, url: str) -> bool:
+        if self.blob_index is None:
+            return False
+        return self.blob_index.release(url, lambda public_id: cloudinary.uploader.destroy(public_id, invalidate=True)) is not None
+
+    def _upload(self, file, digest: str, directory: str, prefix: str) -> Tuple[str, str]:
         # Using directory as 'folder' in Cloudinary
-        filename_parts = original_filename.split('.')
-        public_id = filename_parts[0]
-        if prefix:
-             public_id = f"{prefix}_{public_id}_{uuid.uuid4()}"
-        else:
-             public_id = f"{public_id}_{uuid.uuid4()}"
+        public_id = f"{directory}/{_content_name(digest, prefix)}"
 
-        result = cloudinary.uploader.upload(
-            file_bytes, 
-            folder=directory,
-            public_id=public_id,
-            resource_type="auto"
-        )
-        return result['public_id'], result['secure_url']
+        def store(known_url: Optional[str]) -> str:
+            if known_url is not None:
+                return known_url
+            result = cloudinary.uploader.upload(
+                file,
+                public_id=public_id,
+                overwrite=False,
+                resource_type="auto"
+            )
+            return result['secure_url']
 
-    def save_stream(self, file_stream: BinaryIO, original_filename: str, directory: str, prefix: str = "") -> Tuple[str, str]:
-        filename_parts = original_filename.split('.')
-        public_id = filename_parts[0]
-        if prefix:
-             public_id = f"{prefix}_{public_id}_{uuid.uuid4()}"
-        else:
-             public_id = f"{public_id}_{uuid.uuid4()}"
-             
-        result = cloudinary.uploader.upload(
-            file_stream,
-            folder=directory,
-            public_id=public_id,
-            resource_type="auto"
-        )
-        return result['public_id'], result['secure_url']
+        if self.blob_index is None:
+            return public_id, store(None)
+        return public_id, self.blob_index.acquire(public_id, store)
@@ -0,0 +1,164 @@
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+from urllib.parse import urlparse
+
+from ..core.metrics import metrics
+from ..repositories.interfaces import IFileReferenceRepository
+from .storage import LocalFileStorage
+
+UPLOADS_DIR = "uploads"
+
+# Files younger than this are never collected: their row may not be committed yet
+GC_MIN_AGE_SECONDS = float(os.getenv("GC_MIN_AGE_SECONDS", str(24 * 3600)))
+# Inputs of failed, cancelled or timed-out jobs are kept this long, then collected (0 keeps them)
+GC_FAILED_INPUT_RETENTION_DAYS = float(os.getenv("GC_FAILED_INPUT_RETENTION_DAYS", "7"))
+# Deletes run in batches with a pause in between, so a large backlog does not saturate the disk
+GC_BATCH_SIZE = int(os.getenv("GC_BATCH_SIZE", "500"))
+GC_BATCH_PAUSE_SECONDS = float(os.getenv("GC_BATCH_PAUSE_SECONDS", "1.0"))
+# Only reports orphans and disk usage; set to 0 once the reported orphans look right
+GC_DRY_RUN = os.getenv("GC_DRY_RUN", "1") == "1"
+
+def url_path(url: str, base_url: str = "", root: str = UPLOADS_DIR) -> Optional[str]:
+    """
+    Relative path of the file behind a URL, or None when it is not under 'root' (e.g. Cloudinary).
+    "https://host/backend/uploads/images/ab/cd/x.jpg" -> "uploads/images/ab/cd/x.jpg" with base_url
+    "https://host/backend". URLs built from another base (models, an earlier API_BASE_URL) are
+    matched from their first 'root' segment instead.
+    """
+    base = base_url.rstrip("/") + "/"
+    if base_url and url.startswith(base) and url[len(base):].startswith(root + "/"):
+        return url[len(base):]
+    segments = urlparse(url).path.split("/")
+    if root not in segments:
+        return None
+    return "/".join(segments[segments.index(root):])
+
+def walk_files(root: str) -> Iterator[os.DirEntry]:
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False) and not entry.name.startswith("."):
+                    # Dotfiles are bookkeeping (the GC lock), never uploads
+                    yield entry
+
+def referenced_paths(urls: Iterable[str], derivatives: Dict[str, List[str]], base_url: str, root: str) -> Set[str]:
+    """Paths of the files behind 'urls', plus the derivatives of each ('derivatives': original path -> paths)."""
+    paths = {path for path in (url_path(url, base_url, root) for url in urls) if path}
+    paths.update(derived for path in list(paths) for derived in derivatives.get(path, ()))
+    return paths
+
+def derivative_paths(references: IFileReferenceRepository, base_url: str, root: str) -> Dict[str, List[str]]:
+    derivatives: Dict[str, List[str]] = {}
+    for original_url, url in references.iter_derivative_urls():
+        original, path = url_path(original_url, base_url, root), url_path(url, base_url, root)
+        if original and path:
+            derivatives.setdefault(original, []).append(path)
+    return derivatives
+
+def collect_garbage(references: IFileReferenceRepository, storage: LocalFileStorage,
+                    root: str = UPLOADS_DIR, min_age_seconds: float = GC_MIN_AGE_SECONDS,
+                    batch_size: int = GC_BATCH_SIZE, pause_seconds: float = GC_BATCH_PAUSE_SECONDS,
+                    dry_run: bool = GC_DRY_RUN) -> dict:
+    """
+    Deletes the files under 'root' that no part, job or job view refers to, and reports
+    disk usage per top-level directory (images, inputs, derived, models) as metrics.
+    Reference URLs are mapped to files by stripping the base URL of 'storage'.
+
+    Files are deleted in paced batches long after the scan, so before each batch the rows changed
+    since the age cutoff are read again, and each file is stat'ed again right before removal: a
+    deduplicated save in between refreshes its mtime (see storage._touch). When no reference
+    matches any file on disk (the URLs are likely mapped wrong) nothing is deleted.
+    """
+    result = {"orphans": 0, "deleted": 0, "deletedBytes": 0, "aborted": False, "dryRun": dry_run}
+    if not os.path.isdir(root):
+        return result
+
+    started = time.perf_counter()
+    expired_before = None
+    if GC_FAILED_INPUT_RETENTION_DAYS > 0:
+        expired_before = datetime.now(timezone.utc) - timedelta(days=GC_FAILED_INPUT_RETENTION_DAYS)
+    derivatives = derivative_paths(references, storage.base_url, root)
+    in_use = referenced_paths(references.iter_referenced_urls(expired_before=expired_before), derivatives,
+                              storage.base_url, root)
+
+    cutoff = time.time() - min_age_seconds
+    changed_since = datetime.now(timezone.utc) - timedelta(seconds=min_age_seconds)
+    usage: Dict[str, List[int]] = {}
+    directory_entries: Dict[str, int] = {}
+    orphans = []
+    matched = 0
+    for entry in walk_files(root):
+        stat = entry.stat(follow_symlinks=False)
+        relative = os.path.relpath(entry.path, root)
+        top = relative.split(os.sep, 1)[0] if os.sep in relative else "."
+        files_and_bytes = usage.setdefault(top, [0, 0])
+        files_and_bytes[0] += 1
+        files_and_bytes[1] += stat.st_size
+        parent = os.path.dirname(entry.path)
+        directory_entries[parent] = directory_entries.get(parent, 0) + 1
+
+        if entry.path.replace(os.sep, "/") in in_use:
+            matched += 1
+        elif stat.st_mtime < cutoff:
+            orphans.append((entry.path, stat.st_size, top))
+
+    result["orphans"] = len(orphans)
+    if orphans and not matched:
+        print(f"Uploads garbage collection aborted: none of {len(in_use)} referenced files found under {root}")
+        metrics.increment("gc.aborted")
+        result["aborted"] = True
+    elif not dry_run:
+        for start in range(0, len(orphans), batch_size):
+            if start:
+                time.sleep(pause_seconds)
+            in_use |= referenced_paths(
+                references.iter_referenced_urls(expired_before=expired_before, changed_since=changed_since),
+                derivatives, storage.base_url, root,
+            )
+            removed = []
+            for path, size, top in orphans[start:start + batch_size]:
+                if path.replace(os.sep, "/") in in_use or not _is_older(path, cutoff):
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                removed.append(path)
+                usage[top][0] -= 1
+                usage[top][1] -= size
+                result["deletedBytes"] += size
+                _remove_empty_parents(path, root)
+            references.forget_files(removed, [storage.url_for(path) for path in removed])
+            result["deleted"] += len(removed)
+
+    for top, (files, size) in usage.items():
+        metrics.set_gauge(f"storage.files.{top}", files)
+        metrics.set_gauge(f"storage.bytes.{top}", size)
+    metrics.set_gauge("storage.bytes", sum(size for _, size in usage.values()))
+    metrics.set_gauge("storage.max_directory_entries", max(directory_entries.values(), default=0))
+    metrics.set_gauge("storage.orphans", len(orphans) - result["deleted"])
+    metrics.increment("gc.deleted_files", result["deleted"])
+    metrics.increment("gc.deleted_bytes", result["deletedBytes"])
+    metrics.observe("gc.seconds", time.perf_counter() - started)
+    return result
+
+def _is_older(path: str, cutoff: float) -> bool:
+    try:
+        return os.stat(path).st_mtime < cutoff
+    except FileNotFoundError:
+        return False
+
+def _remove_empty_parents(path: str, root: str):
+    # Drops shard directories left empty, up to (not including) the top-level directories
+    parent = os.path.dirname(path)
+    while os.path.dirname(os.path.relpath(parent, root)):
+        try:
+            os.rmdir(parent)
+        except OSError:
+            return
+        parent = os.path.dirname(parent)
@@ -0,0 +1,170 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+import traceback
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ..core.metrics import metrics
+
+# Lower runs first. Operators wait at the line for comparisons; reference builds can wait
+PRIORITY_CLASSES = {"interactive": 0, "batch": 1}
+
+def parse_quotas(spec: str) -> Dict[str, int]:
+    # "reference:1,sample:2" -> {"reference": 1, "sample": 2}
+    quotas = {}
+    for item in filter(None, (chunk.strip() for chunk in spec.split(","))):
+        part_type, _, limit = item.partition(":")
+        quotas[part_type.strip()] = int(limit)
+    return quotas
+
+# Worker threads shared by every reconstruction
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", "2"))
+# Maximum reconstructions running at once per part type (comparison jobs use "comparison").
+# The default keeps reference builds to one worker, so a bulk import always leaves room for comparisons
+PART_TYPE_QUOTAS = parse_quotas(os.getenv("PART_TYPE_QUOTAS", "reference:1"))
+# Seconds of waiting that promote a task by one priority class, so batch work is never starved
+SCHEDULER_AGING_SECONDS = float(os.getenv("SCHEDULER_AGING_SECONDS", "60"))
+# Seconds shutdown waits for running reconstructions before failing their jobs
+SCHEDULER_SHUTDOWN_TIMEOUT = float(os.getenv("SCHEDULER_SHUTDOWN_TIMEOUT", "30"))
+
+@dataclass
+class ScheduledTask:
+    func: Callable
+    args: tuple
+    kwargs: dict
+    priority_class: str
+    part_type: str
+    # Called when the scheduler stops before the task ends: instead of 'func' if it never ran,
+    # or while 'func' is still running if it outlived the shutdown timeout
+    on_drop: Optional[Callable[[], None]] = None
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+class JobScheduler:
+    """
+    Priority scheduler for background reconstructions, replacing the unordered FastAPI background tasks.
+
+    Tasks run on a fixed pool of threads. The next task is the one with the lowest
+    'class priority * aging_seconds + enqueue time' among the part types still under their quota.
+    Since every task ages at the same rate that key never changes, so each part type keeps a plain
+    heap and picking a task only compares the heads.
+    """
+    def __init__(self, workers: int = SCHEDULER_WORKERS, quotas: Optional[Dict[str, int]] = None,
+                 aging_seconds: float = SCHEDULER_AGING_SECONDS):
+        self.workers = workers
+        self.quotas = PART_TYPE_QUOTAS if quotas is None else quotas
+        self.aging_seconds = aging_seconds
+        self._queues: Dict[str, List[Tuple[float, int, ScheduledTask]]] = {}
+        self._running: Dict[str, int] = {}
+        self._active: Dict[int, ScheduledTask] = {}
+        self._counts: Dict[Tuple[str, str], int] = {}
+        self._sequence = itertools.count()
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+        self._condition = threading.Condition()
+
+    def submit(self, func: Callable, *args, priority_class: str = "batch", part_type: str = "",
+               on_drop: Optional[Callable[[], None]] = None, **kwargs) -> None:
+        if priority_class not in PRIORITY_CLASSES:
+            raise ValueError(f"Classe de prioridade desconhecida: {priority_class}")
+
+        task = ScheduledTask(func, args, kwargs, priority_class, part_type, on_drop)
+        key = PRIORITY_CLASSES[priority_class] * self.aging_seconds + task.enqueued_at
+        with self._condition:
+            accepted = not self._stopping
+            if accepted:
+                self._start()
+                heapq.heappush(self._queues.setdefault(part_type, []), (key, next(self._sequence), task))
+                self._count(task, "queued", 1)
+                self._condition.notify()
+        if not accepted:
+            self._drop([task])
+            raise RuntimeError("O agendador está sendo encerrado; a tarefa não foi aceita.")
+
+    def shutdown(self, timeout: float = SCHEDULER_SHUTDOWN_TIMEOUT) -> None:
+        """
+        Stops the workers once their current task ends, waiting up to 'timeout' seconds for them.
+        Queued tasks, and running ones that outlive the wait (the daemon threads die with the
+        interpreter), are dropped through their on_drop hook, so their jobs do not stay pending
+        or processing forever; later submits raise.
+        """
+        with self._condition:
+            self._stopping = True
+            dropped = [entry[2] for queue in self._queues.values() for entry in queue]
+            self._queues.clear()
+            for task in dropped:
+                self._count(task, "queued", -1)
+            self._condition.notify_all()
+        self._drop(dropped)
+
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        with self._condition:
+            abandoned = list(self._active.values())
+        self._drop(abandoned)
+
+    def _drop(self, tasks: List[ScheduledTask]):
+        for task in tasks:
+            if task.on_drop is None:
+                continue
+            try:
+                task.on_drop()
+            except Exception:
+                traceback.print_exc()
+        metrics.increment("scheduler.dropped", len(tasks))
+
+    def _start(self):
+        # Threads are started on first use, so importing the API does not spawn them
+        if not self._threads and not self._stopping:
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"scheduler-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _next_task(self) -> Optional[ScheduledTask]:
+        heads = [
+            (queue[0], part_type) for part_type, queue in self._queues.items()
+            if queue and self._running.get(part_type, 0) < self.quotas.get(part_type, self.workers)
+        ]
+        if not heads:
+            return None
+        _, part_type = min(heads)
+        return heapq.heappop(self._queues[part_type])[2]
+
+    def _count(self, task: ScheduledTask, state: str, delta: int):
+        key = (state, task.priority_class)
+        self._counts[key] = self._counts.get(key, 0) + delta
+        metrics.set_gauge(f"scheduler.{state}.{task.priority_class}", self._counts[key])
+
+    def _work(self):
+        while True:
+            with self._condition:
+                task = None
+                while not self._stopping and task is None:
+                    task = self._next_task()
+                    if task is None:
+                        self._condition.wait()
+                if self._stopping:
+                    return
+                self._running[task.part_type] = self._running.get(task.part_type, 0) + 1
+                self._active[threading.get_ident()] = task
+                self._count(task, "queued", -1)
+                self._count(task, "running", 1)
+
+            metrics.observe(f"scheduler.queue_wait_seconds.{task.priority_class}", time.monotonic() - task.enqueued_at)
+            try:
+                task.func(*task.args, **task.kwargs)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                with self._condition:
+                    self._running[task.part_type] -= 1
+                    self._active.pop(threading.get_ident(), None)
+                    self._count(task, "running", -1)
+                    # A freed quota slot may unblock a task another worker skipped
+                    self._condition.notify_all()
+
+scheduler = JobScheduler()
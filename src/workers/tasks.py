@@ -1,14 +1,57 @@
 from sqlalchemy.orm import Session
+from typing import Dict, List, Optional, Tuple
 from ..services import reconstruction_service
-from ..services.reconstruction_service import ReconstructionService, SilhouetteReconstructionStrategy
+from ..services.reconstruction_service import (
+    CalibratedView, ReconstructionService, SpaceCarvingReconstructionStrategy, create_reconstruction_strategy,
+)
+from ..services.segmentation_service import segmentation_model_for
 from ..core.database import SessionLocal
-from ..repositories.sqlalchemy_impl import SqlAlchemyPartRepository, SqlAlchemyJobRepository
+from ..repositories.sqlalchemy_impl import (
+    SqlAlchemyPartRepository, SqlAlchemyJobRepository, SqlAlchemyStatsRepository, SqlAlchemyDerivativeRepository,
+    SqlAlchemyFileReferenceRepository,
+)
+from ..services.ingest_service import pick_image_url
+from ..services.storage import LocalFileStorage
+from ..services.storage_gc import UPLOADS_DIR, collect_garbage
+from ..core.cancellation import CancellationToken, JobCancelled, JobTimedOut, cancellations
+from ..core.metrics import metrics
+from ..core.lifecycle import state
+import fcntl
 import os
+import time
 
-def process_part_3d_generation(part_id: int, front_url: str, side_url: str):
+# Reconstruction crops the part and clamps it to 300 px, so a ~1k px frame is plenty
+# (strategies that need more, like the adaptive hull, raise it through min_source_side)
+RECONSTRUCTION_MIN_SIDE = int(os.getenv("RECONSTRUCTION_MIN_SIDE", "1024"))
+
+# Default and upper bound of a comparison job's deadline, counted from submission
+JOB_DEADLINE_SECONDS = int(os.getenv("JOB_DEADLINE_SECONDS", "600"))
+JOB_MAX_DEADLINE_SECONDS = int(os.getenv("JOB_MAX_DEADLINE_SECONDS", "3600"))
+
+# Fails at startup the jobs a previous process left pending or processing. Off by default: only
+# safe when a single API process runs at a time, since rolling deploys and 'uvicorn --workers N'
+# start processes while others are still running jobs they would fail
+FAIL_STALE_JOBS_AT_STARTUP = os.getenv("FAIL_STALE_JOBS_AT_STARTUP", "0") == "1"
+
+def resolve_working_urls(*original_urls: str, min_side: int = RECONSTRUCTION_MIN_SIDE) -> List[str]:
+    """Swaps each original for its smallest stored derivative that still meets 'min_side'."""
+    db = SessionLocal()
+    try:
+        derivatives = SqlAlchemyDerivativeRepository(db).get_derivatives(original_urls)
+    finally:
+        db.close()
+    return [pick_image_url(url, derivatives, min_side) for url in original_urls]
+
+def model_url(local_model_path: str) -> str:
+    # Build a local URL to the saved model instead of uploading to Cloudinary
+    base_url = os.getenv("API_BASE_URL", "https://special-rotary-phone-pvwjvqvv95c99jp-8000.app.github.dev")
+    relative_path = os.path.relpath(local_model_path, reconstruction_service.OUTPUT_DIR).replace(os.sep, "/")
+    return f"{base_url}/uploads/models/{relative_path}"
+
+def process_part_3d_generation(part_id: int, front_url: str, side_url: str, part_type: str = "reference"):
     """Generates the 3D model for the Standard Part (Reference) in a worker process."""
     
-    strategy = SilhouetteReconstructionStrategy()
+    strategy = create_reconstruction_strategy(segmentation_model_for(part_type))
     service = ReconstructionService(strategy)
     
     # Models will be kept locally in uploads/models (no cloud upload)
@@ -17,6 +60,10 @@ def process_part_3d_generation(part_id: int, front_url: str, side_url: str):
     import tempfile
     
     try:
+        front_url, side_url = resolve_working_urls(
+            front_url, side_url, min_side=max(RECONSTRUCTION_MIN_SIDE, strategy.min_source_side)
+        )
+
         with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tf_front, \
              tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tf_side:
             
@@ -32,9 +79,7 @@ def process_part_3d_generation(part_id: int, front_url: str, side_url: str):
                 front_path, side_path, "part", part_id
             )
 
-            # Build a local URL to the saved model instead of uploading to Cloudinary
-            base_url = os.getenv("API_BASE_URL", "https://special-rotary-phone-pvwjvqvv95c99jp-8000.app.github.dev")
-            web_url = f"{base_url}/uploads/models/{os.path.basename(local_model_path)}"
+            web_url = model_url(local_model_path)
 
             # Updates the part's model_3d_url field with the local URL
             # OPEN DB SESSION ONLY HERE
@@ -58,68 +103,224 @@ def process_part_3d_generation(part_id: int, front_url: str, side_url: str):
         traceback.print_exc()
         print(f"Critical Error generating 3D for part {part_id}: {e}")
 
-def process_job_3d_generation(job_id: int, front_url: str, side_url: str):
-    """Generates the 3D model for the Comparison Job in a worker process."""
-    
+def job_deadline(seconds: Optional[int] = None) -> float:
+    """Deadline of a job submitted now, as a time.time() timestamp, clamped to JOB_MAX_DEADLINE_SECONDS."""
+    return time.time() + min(seconds or JOB_DEADLINE_SECONDS, JOB_MAX_DEADLINE_SECONDS)
+
+def get_job_status(job_id: int) -> Optional[str]:
+    db = SessionLocal()
+    try:
+        job = SqlAlchemyJobRepository(db).get_job(job_id)
+        return job.status if job else None
+    finally:
+        db.close()
+
+def finish_job(job_id: int, status: str, output_url: Optional[str] = None) -> bool:
+    """Moves a still active job to 'status'; False if it was cancelled (or finished) meanwhile."""
     db = SessionLocal()
     try:
-        job_repo = SqlAlchemyJobRepository(db)
-        job_repo.update_job_status(job_id, "PROCESSING")
+        job = SqlAlchemyJobRepository(db).update_job_status(job_id, status, output_url=output_url, only_if_active=True)
+        return job is not None and job.status == status
     finally:
         db.close()
+
+def start_job(job_id: int, deadline: Optional[float]) -> Optional[CancellationToken]:
+    """
+    Moves the job to PROCESSING and registers its cancellation token.
+    Returns None when the job must not run: cancelled, or out of time, while it was queued.
+    """
+    token = CancellationToken(
+        deadline if deadline is not None else job_deadline(),
+        is_cancelled=lambda: (get_job_status(job_id) or "").upper() == JobCancelled.status,
+    )
+    try:
+        token.check()
+    except JobTimedOut as e:
+        if finish_job(job_id, e.status):
+            metrics.increment("jobs.timed_out_in_queue")
+        return None
+
+    if not finish_job(job_id, "PROCESSING"):
+        return None
+    return cancellations.register(job_id, token)
+
+def drop_job(job_id: int):
+    """
+    Fails a job whose task the scheduler dropped at shutdown, before it ran or while it was
+    still running (see JobScheduler.shutdown); a running one is also asked to stop.
+    """
+    if finish_job(job_id, "FAILED"):
+        metrics.increment("jobs.dropped")
+        print(f"Job {job_id} dropped: the scheduler stopped before it finished")
+    cancellations.cancel(job_id)
+
+def abort_job(job_id: int, reason: JobCancelled, started: float):
+    finish_job(job_id, reason.status)
+    # CPU spent on work nobody will use, bounded by the checkpoint spacing once cancelled
+    metrics.increment(f"jobs.{reason.status.lower()}")
+    metrics.observe("jobs.wasted_seconds", time.perf_counter() - started)
+    print(f"Job {job_id} stopped: {reason.status}")
+
+def complete_job(job_id: int, local_model_path: str, segmentation_report: Optional[Dict[str, str]] = None):
+    web_url = model_url(local_model_path)
+
+    if finish_job(job_id, "COMPLETE", output_url=web_url):
+        print(f"Job {job_id} completed: {web_url}")
+        if segmentation_report:
+            db = SessionLocal()
+            try:
+                SqlAlchemyJobRepository(db).add_segmentation_report(job_id, segmentation_report)
+            finally:
+                db.close()
+    elif os.path.exists(local_model_path):
+        # Cancelled while the model was being written
+        os.remove(local_model_path)
+
+def download_to_temp(url: str, token: CancellationToken, paths: List[str]) -> str:
+    """Downloads 'url' to a temp file whose path is appended to 'paths' first, so the caller always cleans it up."""
+    import requests
+    import tempfile
+
+    token.check()
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tf:
+        paths.append(tf.name)
+        tf.write(requests.get(url, timeout=token.remaining()).content)
+    return tf.name
+
+def process_job_3d_generation(job_id: int, front_url: str, side_url: str, deadline: Optional[float] = None,
+                              part_type: Optional[str] = None):
+    """
+    Generates the 3D model for the Comparison Job in a worker process; 'part_type' is the type
+    of the reference part, which selects the segmentation model.
+    """
     
+    token = start_job(job_id, deadline)
+    if token is None:
+        return
+    started = time.perf_counter()
+
     # Composition Root for Worker Scope
-    strategy = SilhouetteReconstructionStrategy()
+    strategy = create_reconstruction_strategy(segmentation_model_for(part_type))
+    strategy.cancellation = token
     service = ReconstructionService(strategy)
     
     # Models will be kept locally in uploads/models (no cloud upload)
 
-    import requests
-    import tempfile
-    
+    paths = []
     try:
+        front_url, side_url = resolve_working_urls(
+            front_url, side_url, min_side=max(RECONSTRUCTION_MIN_SIDE, strategy.min_source_side)
+        )
+
         # Download images to temp files
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tf_front, \
-             tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tf_side:
-            
-            tf_front.write(requests.get(front_url).content)
-            tf_side.write(requests.get(side_url).content)
-            
-            front_path = tf_front.name
-            side_path = tf_side.name
+        front_path = download_to_temp(front_url, token, paths)
+        side_path = download_to_temp(side_url, token, paths)
+
+        # Call service with 'job' prefix (service already saves model to uploads/models)
+        local_model_path = service.process(front_path, side_path, "job", job_id)
+        complete_job(job_id, local_model_path, strategy.segmentation_report)
+
+    except JobCancelled as e:
+        abort_job(job_id, e, started)
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        print(f"Critical Error in Job {job_id}: {e}")
+        finish_job(job_id, "FAILED")
+
+    finally:
+        cancellations.discard(job_id)
+        for path in paths:
+            if os.path.exists(path): os.remove(path)
+
+
+def process_job_multiview_generation(job_id: int, views: List[Tuple[str, float, Optional[float]]],
+                                     deadline: Optional[float] = None, part_type: Optional[str] = None):
+    """Generates the 3D model of a Comparison Job from N calibrated (url, angle, axis_x) views."""
+
+    token = start_job(job_id, deadline)
+    if token is None:
+        return
+    started = time.perf_counter()
+
+    # Composition Root for Worker Scope
+    strategy = SpaceCarvingReconstructionStrategy(segmentation_model_for(part_type))
+    strategy.cancellation = token
+    service = ReconstructionService(strategy)
+
+    paths = []
+    try:
+        urls = resolve_working_urls(*[url for url, _, _ in views])
+
+        # Download images to temp files
+        for url in urls:
+            download_to_temp(url, token, paths)
+
+        calibrated = [CalibratedView(path, angle, axis_x) for path, (_, angle, axis_x) in zip(paths, views)]
+        local_model_path = service.process_views(calibrated, "job", job_id)
+        complete_job(job_id, local_model_path, strategy.segmentation_report)
+
+    except JobCancelled as e:
+        abort_job(job_id, e, started)
 
-            try:
-                # Call service with 'job' prefix (service already saves model to uploads/models)
-                local_model_path = service.process(
-                    front_path, side_path, "job", job_id
-                )
-
-                # Build a local URL to the saved model instead of uploading to Cloudinary
-                base_url = os.getenv("API_BASE_URL", "https://special-rotary-phone-pvwjvqvv95c99jp-8000.app.github.dev")
-                web_url = f"{base_url}/uploads/models/{os.path.basename(local_model_path)}"
-
-                # 2. Update status to COMPLETE (Quick DB access)
-                db = SessionLocal()
-                try:
-                    job_repo = SqlAlchemyJobRepository(db)
-                    job_repo.update_job_status(job_id, "COMPLETE", output_url=web_url)
-                    print(f"Job {job_id} completed: {web_url}")
-                finally:
-                    db.close()
-                
-            finally:
-                if os.path.exists(front_path): os.remove(front_path)
-                if os.path.exists(side_path): os.remove(side_path)
-        
     except Exception as e:
         import traceback
         traceback.print_exc()
         print(f"Critical Error in Job {job_id}: {e}")
-        
-        # 3. Update status to FAILED (Quick DB access)
+        finish_job(job_id, "FAILED")
+
+    finally:
+        cancellations.discard(job_id)
+        for path in paths:
+            if os.path.exists(path): os.remove(path)
+
+def reconcile_dashboard_stats():
+    """Rebuilds the incrementally maintained dashboard counters from the source tables."""
+
+    db = SessionLocal()
+    try:
+        counters = SqlAlchemyStatsRepository(db).reconcile_counters()
+        print(f"Dashboard counters reconciled: {counters}")
+    except Exception as e:
+        print(f"Error reconciling dashboard counters: {e}")
+    finally:
+        db.close()
+
+def fail_interrupted_jobs():
+    """Fails the jobs a previous process left pending or processing (killed before its shutdown hooks ran)."""
+
+    if not FAIL_STALE_JOBS_AT_STARTUP:
+        return
+    db = SessionLocal()
+    try:
+        # Jobs created since this process started are its own
+        failed = SqlAlchemyJobRepository(db).fail_stale_jobs(time.monotonic() - state.started_at)
+        if failed:
+            metrics.increment("jobs.interrupted", failed)
+            print(f"Failed {failed} job(s) interrupted by a previous shutdown")
+    except Exception as e:
+        print(f"Error failing interrupted jobs: {e}")
+    finally:
+        db.close()
+
+def collect_orphan_uploads():
+    """Deletes uploaded and generated files that no row refers to any more (see services/storage_gc.py)."""
+
+    # Same base URL as the storage wired in core/dependencies.py, to map URLs back to files
+    storage = LocalFileStorage(base_url=os.getenv("API_BASE_URL", "http://localhost:8000"))
+    # One collection at a time on this disk, whatever the number of API processes sharing it
+    with open(os.path.join(UPLOADS_DIR, ".gc.lock"), "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            print("Uploads garbage collection skipped: another process is running it")
+            return
         db = SessionLocal()
         try:
-            job_repo = SqlAlchemyJobRepository(db)
-            job_repo.update_job_status(job_id, "FAILED")
+            result = collect_garbage(SqlAlchemyFileReferenceRepository(db), storage)
+            print(f"Uploads garbage collection: {result}")
+        except Exception as e:
+            print(f"Error collecting orphan uploads: {e}")
         finally:
-             db.close()
+            db.close()